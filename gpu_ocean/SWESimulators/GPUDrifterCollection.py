@@ -26,19 +26,64 @@ from matplotlib import pyplot as plt
 import matplotlib.gridspec as gridspec
 import numpy as np
 import time
+import os
+import logging
 import pycuda.driver as cuda
+import pycuda.gpuarray
 
 from SWESimulators import Common
 from SWESimulators import BaseDrifterCollection
 
+class StagedDrifterDownload(object):
+    """
+    Handle to an asynchronous download of drifter positions into one of the 
+    pinned staging buffers of a GPUDrifterCollection.
+    """
+    def __init__(self, host_buffer, done_event):
+        self.host_buffer = host_buffer
+        self.done_event = done_event
+        self.positions = None
+        
+    def sync(self):
+        """
+        Waits for the download to finish, and returns the drifter positions.
+        """
+        if self.positions is None:
+            self.done_event.synchronize()
+            self.positions = self.host_buffer[:, :-1].T.copy()
+        return self.positions
+    
+
 class GPUDrifterCollection(BaseDrifterCollection.BaseDrifterCollection):
+    
+    # Block width used unless another is requested
+    default_block_width = 64
+    
+    # Candidate block widths for the autotuner, and the best block width found 
+    # for each device and number of drifters, keyed by 
+    # (device name, compute capability, bit length of the number of drifters)
+    autotune_block_widths = [32, 64, 128, 256, 512]
+    autotuned_block_widths = {}
+    
     def __init__(self, gpu_ctx, numDrifters, \
                  observation_variance=0.01, \
                  boundaryConditions=Common.BoundaryConditions(), \
                  initialization_cov_drifters=None, \
                  domain_size_x=1.0, domain_size_y=1.0, \
                  gpu_stream=None, \
-                 block_width = 64):
+                 block_width = None, \
+                 autotune_block_width = False, \
+                 half_precision_downloads = False):
+        """
+        block_width: Number of threads per block in the drift kernels. If None, it is read
+            from the environment variable GPU_OCEAN_DRIFTER_TPB, or autotuned if 
+            autotune_block_width is True, and is otherwise default_block_width.
+        half_precision_downloads: Download positions from the GPU as half floats 
+            relative to the domain size. This halves the download size, but the 
+            positions returned by the getters are only accurate to within 
+            domain_size/4096, half a float16 ulp below 1. The drifters are always
+            moved in single precision.
+        """
         
         super(GPUDrifterCollection, self).__init__(numDrifters,
                                 observation_variance=observation_variance,
@@ -46,9 +91,15 @@ class GPUDrifterCollection(BaseDrifterCollection.BaseDrifterCollection):
                                 domain_size_x=domain_size_x, 
                                 domain_size_y=domain_size_y)
         
+        self.logger = logging.getLogger(__name__)
+        
+        # Set before anything is allocated, so that cleanUp works even if the constructor fails
+        self.half_precision_downloads = half_precision_downloads
+        self.driftersDevice = None
+        self.driftersHalfDevice = None
+        
         # Define CUDA environment:
         self.gpu_ctx = gpu_ctx
-        self.block_width = block_width
         self.block_height = 1
         
         # TODO: Where should the cl_queue come from?
@@ -57,27 +108,64 @@ class GPUDrifterCollection(BaseDrifterCollection.BaseDrifterCollection):
         self.gpu_stream = gpu_stream
         if self.gpu_stream is None:
             self.gpu_stream = cuda.Stream()
+        
+        self.block_width = block_width
+        if self.block_width is None:
+            self.block_width = self._getBlockWidth(autotune_block_width)
                 
         self.sensitivity = 1.0
+        self._updateKernelArguments()
          
-        self.driftersHost = np.zeros((self.getNumDrifters() + 1, 2)).astype(np.float32, order='C')
+        # Page-locked host buffer for all drifters and the observation, so that
+        # transfers to and from the GPU avoid the driver's internal staging copy.
+        # The positions are stored as structure of arrays, with all x coordinates 
+        # in the first row and all y coordinates in the second row, so that 
+        # consecutive threads read consecutive floats. The last column is the observation.
+        self.driftersHost = cuda.pagelocked_zeros((2, self.getNumDrifters() + 1), dtype=np.float32, \
+                                                  mem_flags=cuda.host_alloc_flags.PORTABLE)
         self.driftersDevice = Common.CUDAArray2D(self.gpu_stream, \
-                                                 2, self.getNumDrifters()+1, 0, 0, \
+                                                 self.getNumDrifters()+1, 2, 0, 0, \
                                                  self.driftersHost)
+        # Uploads from the pinned buffer are asynchronous, so the setters wait for
+        # the latest one to finish before they overwrite the buffer.
+        self.uploadDoneEvent = cuda.Event()
+        self.uploadDoneEvent.record(self.gpu_stream)
         
-        self.drift_kernels = gpu_ctx.get_kernel("driftKernels.cu", \
-                                                defines={'block_width': self.block_width, 'block_height': self.block_height})
-
-        # Get CUDA functions and define data types for prepared_{async_}call()
-        self.passiveDrifterKernel = self.drift_kernels.get_function("passiveDrifterKernel")
-        self.passiveDrifterKernel.prepare("iifffiiPiPiPiPiiiiPif")
-        self.enforceBoundaryConditionsKernel = self.drift_kernels.get_function("enforceBoundaryConditions")
-        self.enforceBoundaryConditionsKernel.prepare("ffiiiPi")
+        # Device and pinned host buffers for positions packed as half floats
+        if self.half_precision_downloads:
+            self.driftersHalfDevice = pycuda.gpuarray.empty((2, self.getNumDrifters() + 1), dtype=np.float16)
+            self.driftersHalfHost = cuda.pagelocked_zeros((2, self.getNumDrifters() + 1), dtype=np.float16, \
+                                                          mem_flags=cuda.host_alloc_flags.PORTABLE)
+        
+        # Two pinned staging buffers, each downloaded on its own stream, so that one 
+        # download can overlap the processing of the previous one
+        self.stagingHost = [cuda.pagelocked_zeros((2, self.getNumDrifters() + 1), dtype=np.float32, \
+                                                  mem_flags=cuda.host_alloc_flags.PORTABLE) for i in range(2)]
+        self.stagingStreams = [cuda.Stream() for i in range(2)]
+        self.stagingReadyEvents = [cuda.Event() for i in range(2)]
+        self.stagingDoneEvents = [cuda.Event() for i in range(2)]
+        self.stagingDownloads = [None, None]
+        self.stagingSlot = 0
+        
+        # The host buffer mirrors the device buffer until the drifters are moved on 
+        # the GPU. While the mirror is up to date, positions are read from the host, 
+        # and otherwise the mirror is refreshed with a single download.
+        self.hostPositionsOutdated = False
+        
+        self.passiveDrifterKernel, self.enforceBoundaryConditionsKernel = \
+            self._getKernels(self.block_width)
+        if self.half_precision_downloads:
+            drift_kernels = gpu_ctx.get_kernel("driftKernels.cu", \
+                                               defines={'block_width': self.block_width, 'block_height': self.block_height})
+            self.packDriftersHalfKernel = drift_kernels.get_function("packDriftersHalf")
+            self.packDriftersHalfKernel.prepare("ffiPiP")
         
         self.local_size = (self.block_width, self.block_height, 1)
-        self.global_size = (\
-                            int(np.ceil((self.getNumDrifters() + 2)/float(self.block_width))), \
-                            1)
+        self.global_size = self._getGlobalSize(self.block_width)
+        
+        # passiveDrifterKernel specialized for the grid given to drift(), 
+        # compiled on first use and kept for each (nx, ny, dx, dy)
+        self.specializedDrifterKernels = {}
         
         # Initialize drifters:
         self.uniformly_distribute_drifters(initialization_cov_drifters=initialization_cov_drifters)
@@ -102,10 +190,16 @@ class GPUDrifterCollection(BaseDrifterCollection.BaseDrifterCollection):
                                 domain_size_x = self.domain_size_x, 
                                 domain_size_y = self.domain_size_y,
                                 gpu_stream = self.gpu_stream,
-                                block_width = self.block_width)
+                                block_width = self.block_width,
+                                half_precision_downloads = self.half_precision_downloads)
         
-        copyOfSelf.setDrifterPositions(self.getDrifterPositions())
-        copyOfSelf.setObservationPosition(self.getObservationPosition())
+        # Copy the drifters and the observation directly on the GPU, and copy the 
+        # host mirror in place, instead of taking a round trip through the host.
+        # Both streams are the same, so the copy is ordered after any pending drift.
+        copyOfSelf.driftersDevice.copyBuffer(self.gpu_stream, self.driftersDevice)
+        copyOfSelf.uploadDoneEvent.synchronize()
+        np.copyto(copyOfSelf.driftersHost, self.driftersHost)
+        copyOfSelf.hostPositionsOutdated = self.hostPositionsOutdated
         
         return copyOfSelf
     
@@ -114,57 +208,308 @@ class GPUDrifterCollection(BaseDrifterCollection.BaseDrifterCollection):
     def setDrifterPositions(self, newDrifterPositions):
         ### Need to attache the observation to the newDrifterPositions, and then upload
         # to the GPU
-        newPositionsAll = np.concatenate((newDrifterPositions, np.array([self.getObservationPosition()])), \
-                                         axis=0)
-        #print newPositionsAll
-        self.driftersDevice.upload(self.gpu_stream, newPositionsAll)
+        # Validate the shape up front, since np.copyto would otherwise broadcast 
+        # a single position to all drifters
+        assert(np.shape(newDrifterPositions) == (self.getNumDrifters(), 2)), \
+            "Got drifter positions of shape " + str(np.shape(newDrifterPositions)) + \
+            ", but expected " + str((self.getNumDrifters(), 2))
+        
+        # The pinned buffer is uploaded asynchronously, so make sure that the 
+        # previous upload is finished before we overwrite it.
+        # The positions are cast to float32 directly into the pinned buffer, which
+        # is contiguous float32, so the upload needs no further conversion or copy.
+        self.uploadDoneEvent.synchronize()
+        np.copyto(self.driftersHost[:, :-1], np.transpose(newDrifterPositions), casting='same_kind')
+        self._waitForStagedDownloads()
+        
+        # Only the drifters are uploaded (the first numDrifters entries of each row), 
+        # so the observation on the GPU is left untouched
+        for row in range(2):
+            row_ptr = int(self.driftersDevice.data.gpudata) + int(self.driftersDevice.pitch)*row
+            cuda.memcpy_htod_async(row_ptr, self.driftersHost[row, :-1], stream=self.gpu_stream)
+        self.uploadDoneEvent.record(self.gpu_stream)
     
     def setObservationPosition(self, newObservationPosition):
-        newPositionsAll = np.concatenate((self.getDrifterPositions(), np.array([newObservationPosition])))
-        self.driftersDevice.upload(self.gpu_stream, newPositionsAll)
+        # Only the last column (the observation) is written to the GPU, so the drifters
+        # do not need to take a round trip through the host.
+        assert(np.size(newObservationPosition) == 2), \
+            "Got observation position of size " + str(np.size(newObservationPosition)) + ", but expected 2"
+        self.uploadDoneEvent.synchronize()
+        np.copyto(self.driftersHost[:, self.obs_index], np.ravel(newObservationPosition), casting='same_kind')
+        self._waitForStagedDownloads()
+        for row in range(2):
+            obs_ptr = int(self.driftersDevice.data.gpudata) + int(self.driftersDevice.pitch)*row \
+                      + self.driftersHost.itemsize*self.obs_index
+            cuda.memcpy_htod_async(obs_ptr, self.driftersHost[row, self.obs_index:self.obs_index+1], \
+                                   stream=self.gpu_stream)
+        self.uploadDoneEvent.record(self.gpu_stream)
         
     def setSensitivity(self, sensitivity):
         self.sensitivity = sensitivity
+        self._updateKernelArguments()
+        
+    def setBoundaryConditions(self, boundaryConditions):
+        super(GPUDrifterCollection, self).setBoundaryConditions(boundaryConditions)
+        self._updateKernelArguments()
+        
+    def setDomainSize(self, size_x, size_y):
+        super(GPUDrifterCollection, self).setDomainSize(size_x, size_y)
+        self._updateKernelArguments()
+        
+    def _updateKernelArguments(self):
+        """
+        Boxes the kernel arguments that only change through the setters, so that 
+        this is not repeated for every kernel launch.
+        """
+        self.periodic_north_south = np.int32(self.boundaryConditions.isPeriodicNorthSouth())
+        self.periodic_east_west = np.int32(self.boundaryConditions.isPeriodicEastWest())
+        self.num_drifters_int32 = np.int32(self.getNumDrifters())
+        self.sensitivity_float32 = np.float32(self.sensitivity)
+        self.domain_size_x_float32 = np.float32(self.domain_size_x)
+        self.domain_size_y_float32 = np.float32(self.domain_size_y)
         
     def getDrifterPositions(self):
-        allDrifters = self.driftersDevice.download(self.gpu_stream)
-        return allDrifters[:-1, :]
+        return self._snapshotHost()[:, :-1].T.copy()
     
     def getObservationPosition(self):
-        allDrifters = self.driftersDevice.download(self.gpu_stream)
-        return allDrifters[self.obs_index, :]
+        return self._snapshotHost()[:, self.obs_index].copy()
+    
+    def getAllPositions(self):
+        """
+        Returns both the drifter positions and the observation position, 
+        based on a single download from the GPU.
+        """
+        allDrifters = self._snapshotHost()
+        return allDrifters[:, :-1].T.copy(), allDrifters[:, self.obs_index].copy()
+    
+    def getDrifterPositionsAsync(self):
+        """
+        Starts downloading the drifter positions on a separate stream, and returns 
+        a StagedDrifterDownload whose sync() gives the positions. The two staging 
+        buffers are used in turn, so that the next download can be issued while 
+        the previous positions are processed.
+        """
+        slot = self.stagingSlot
+        self.stagingSlot = 1 - slot
+        
+        # Resolve the download that used this slot before we overwrite its buffer
+        if self.stagingDownloads[slot] is not None:
+            self.stagingDownloads[slot].sync()
+        
+        # Download the drifters as they are after all work queued so far on gpu_stream
+        self.stagingReadyEvents[slot].record(self.gpu_stream)
+        self.stagingStreams[slot].wait_for_event(self.stagingReadyEvents[slot])
+        cuda.memcpy_dtoh_async(self.stagingHost[slot], self.driftersDevice.data.gpudata, \
+                               stream=self.stagingStreams[slot])
+        self.stagingDoneEvents[slot].record(self.stagingStreams[slot])
+        
+        self.stagingDownloads[slot] = StagedDrifterDownload(self.stagingHost[slot], \
+                                                            self.stagingDoneEvents[slot])
+        return self.stagingDownloads[slot]
+    
+    def _waitForStagedDownloads(self):
+        """
+        Makes gpu_stream wait for pending staged downloads before the drifters 
+        on the GPU are overwritten.
+        """
+        for event in self.stagingDoneEvents:
+            self.gpu_stream.wait_for_event(event)
+    
+    def _snapshotHost(self):
+        """
+        Returns the pinned host buffer with all drifters and the observation, after 
+        downloading it from the GPU if the drifters have moved since the last transfer.
+        """
+        if self.hostPositionsOutdated:
+            if self.half_precision_downloads:
+                self.packDriftersHalfKernel.prepared_async_call(self.global_size, self.local_size, self.gpu_stream, \
+                                                                self.domain_size_x_float32, \
+                                                                self.domain_size_y_float32, \
+                                                                self.num_drifters_int32, \
+                                                                self.driftersDevice.data.gpudata, \
+                                                                self.driftersDevice.pitch, \
+                                                                self.driftersHalfDevice.gpudata)
+                self.driftersHalfDevice.get_async(stream=self.gpu_stream, ary=self.driftersHalfHost)
+                self.gpu_stream.synchronize()
+                # Scale in single precision, as a float16 product would round a second time
+                np.multiply(self.driftersHalfHost[0, :], self.domain_size_x_float32, out=self.driftersHost[0, :], dtype=np.float32)
+                np.multiply(self.driftersHalfHost[1, :], self.domain_size_y_float32, out=self.driftersHost[1, :], dtype=np.float32)
+            else:
+                self.driftersDevice.data.get_async(stream=self.gpu_stream, ary=self.driftersHost)
+                self.gpu_stream.synchronize()
+            self.hostPositionsOutdated = False
+        return self.driftersHost
     
     def drift(self, eta, hu, hv, Hm, nx, ny, dx, dy, dt, \
               x_zero_ref, y_zero_ref):
-        self.passiveDrifterKernel.prepared_async_call(self.global_size, self.local_size, self.gpu_stream, \
+        self._waitForStagedDownloads()
+        passiveDrifterKernel = self._getSpecializedDrifterKernel(nx, ny, dx, dy)
+        passiveDrifterKernel.prepared_async_call(self.global_size, self.local_size, self.gpu_stream, \
                                                nx, ny, dx, dy, dt, x_zero_ref, y_zero_ref, \
                                                eta.data.gpudata, eta.pitch, \
                                                hu.data.gpudata, hu.pitch, \
                                                hv.data.gpudata, hv.pitch, \
                                                Hm.data.gpudata, Hm.pitch, \
-                                               np.int32(self.boundaryConditions.isPeriodicNorthSouth()), \
-                                               np.int32(self.boundaryConditions.isPeriodicEastWest()), \
-                                               np.int32(self.getNumDrifters()), \
+                                               self.periodic_north_south, \
+                                               self.periodic_east_west, \
+                                               self.num_drifters_int32, \
                                                self.driftersDevice.data.gpudata, \
                                                self.driftersDevice.pitch, \
-                                               np.float32(self.sensitivity))
+                                               self.sensitivity_float32)
+        self.hostPositionsOutdated = True
 
+    def _getKernels(self, block_width, grid_defines={}):
+        """
+        Returns the prepared drift kernels compiled for the given block width,
+        and optionally specialized for a grid (see _getSpecializedDrifterKernel).
+        The compiled modules are cached by the gpu_ctx for each set of defines.
+        """
+        defines = {'block_width': block_width, 'block_height': self.block_height}
+        defines.update(grid_defines)
+        drift_kernels = self.gpu_ctx.get_kernel("driftKernels.cu", defines=defines)
+
+        # Get CUDA functions and define data types for prepared_{async_}call()
+        passiveDrifterKernel = drift_kernels.get_function("passiveDrifterKernel")
+        passiveDrifterKernel.prepare("iifffiiPiPiPiPiiiiPif")
+        enforceBoundaryConditionsKernel = drift_kernels.get_function("enforceBoundaryConditions")
+        enforceBoundaryConditionsKernel.prepare("ffiiiPi")
+        
+        return passiveDrifterKernel, enforceBoundaryConditionsKernel
+    
+    def _getSpecializedDrifterKernel(self, nx, ny, dx, dy):
+        """
+        Returns passiveDrifterKernel with the grid compiled in as constants, 
+        so that the compiler can fold the cell size and domain size.
+        The specialized kernel takes the same arguments as the generic one, 
+        but ignores nx, ny, dx and dy.
+        """
+        key = (int(nx), int(ny), float(dx), float(dy))
+        if key not in self.specializedDrifterKernels:
+            float_literal = lambda value: "{:.9e}f".format(np.float32(value))
+            grid_defines = {
+                'DRIFT_NX': key[0], 'DRIFT_NY': key[1],
+                'DRIFT_DX': float_literal(dx), 'DRIFT_DY': float_literal(dy),
+                'DRIFT_INV_DX': float_literal(1.0/np.float32(dx)), 
+                'DRIFT_INV_DY': float_literal(1.0/np.float32(dy))
+            }
+            self.specializedDrifterKernels[key], _ = self._getKernels(self.block_width, grid_defines)
+        return self.specializedDrifterKernels[key]
+    
+    def _getGlobalSize(self, block_width):
+        """
+        One thread per drifter, but never more than two blocks per multiprocessor.
+        The drift kernels loop over the remaining drifters (grid-stride loop).
+        """
+        sm_count = self.gpu_ctx.cuda_device.get_attribute(cuda.device_attribute.MULTIPROCESSOR_COUNT)
+        num_blocks = int(np.ceil((self.getNumDrifters() + 2)/float(block_width)))
+        return (min(2*sm_count, num_blocks), 1)
+    
+    def _getBlockWidth(self, autotune):
+        """
+        Returns the block width given by the environment variable GPU_OCEAN_DRIFTER_TPB.
+        Otherwise, returns the autotuned block width for the current device and a similar
+        number of drifters if autotune is True, and default_block_width if not.
+        """
+        env_block_width = os.environ.get("GPU_OCEAN_DRIFTER_TPB")
+        if env_block_width is not None:
+            return int(env_block_width)
+        
+        if not autotune:
+            return self.default_block_width
+        
+        # Collections whose number of drifters are within the same power of two share the result
+        device = self.gpu_ctx.cuda_device
+        tune_key = (device.name(), device.compute_capability(), int(self.getNumDrifters()).bit_length())
+        if tune_key not in GPUDrifterCollection.autotuned_block_widths:
+            GPUDrifterCollection.autotuned_block_widths[tune_key] = self._autotuneBlockWidth()
+            self.logger.info("Autotuned drifter block width for '%s' and %d drifters: %d", \
+                             device.name(), self.getNumDrifters(), 
+                             GPUDrifterCollection.autotuned_block_widths[tune_key])
+        return GPUDrifterCollection.autotuned_block_widths[tune_key]
+    
+    def _autotuneBlockWidth(self, nx=8, ny=8, num_iterations=10):
+        """
+        Times passiveDrifterKernel for each candidate block width on a small 
+        ocean at rest, and returns the fastest block width.
+        """
+        # Ocean at rest, so that the drifters stay in the cell at the origin
+        zeros = np.zeros((ny+4, nx+4), dtype=np.float32)
+        eta = Common.CUDAArray2D(self.gpu_stream, nx, ny, 2, 2, zeros)
+        hu = Common.CUDAArray2D(self.gpu_stream, nx, ny, 2, 2, zeros)
+        hv = Common.CUDAArray2D(self.gpu_stream, nx, ny, 2, 2, zeros)
+        Hm = Common.CUDAArray2D(self.gpu_stream, nx, ny, 2, 2, np.ones_like(zeros))
+        drifters = Common.CUDAArray2D(self.gpu_stream, self.getNumDrifters()+1, 2, 0, 0, \
+                                      np.zeros((2, self.getNumDrifters()+1), dtype=np.float32))
+        
+        start = cuda.Event()
+        end = cuda.Event()
+        
+        best_block_width = None
+        best_time = np.inf
+        for block_width in self.autotune_block_widths:
+            if block_width > self.gpu_ctx.cuda_device.get_attribute(cuda.device_attribute.MAX_THREADS_PER_BLOCK):
+                continue
+            passiveDrifterKernel, _ = self._getKernels(block_width)
+            global_size = self._getGlobalSize(block_width)
+            local_size = (block_width, self.block_height, 1)
+            
+            def launch():
+                passiveDrifterKernel.prepared_async_call(global_size, local_size, self.gpu_stream, \
+                                               np.int32(nx), np.int32(ny), np.float32(1.0), np.float32(1.0), \
+                                               np.float32(0.0), np.int32(2), np.int32(2), \
+                                               eta.data.gpudata, eta.pitch, \
+                                               hu.data.gpudata, hu.pitch, \
+                                               hv.data.gpudata, hv.pitch, \
+                                               Hm.data.gpudata, Hm.pitch, \
+                                               np.int32(0), np.int32(0), \
+                                               np.int32(self.getNumDrifters()), \
+                                               drifters.data.gpudata, \
+                                               drifters.pitch, \
+                                               np.float32(1.0))
+            
+            # Warm up before timing
+            launch()
+            start.record(self.gpu_stream)
+            for i in range(num_iterations):
+                launch()
+            end.record(self.gpu_stream)
+            end.synchronize()
+            
+            elapsed = end.time_since(start)
+            if elapsed < best_time:
+                best_time = elapsed
+                best_block_width = block_width
+        
+        for buffer in [eta, hu, hv, Hm, drifters]:
+            buffer.release()
+        
+        return best_block_width
+    
     def setGPUStream(self, gpu_stream):
         self.gpu_stream = gpu_stream
         
     def cleanUp(self):
         if (self.driftersDevice is not None):
             self.driftersDevice.release()
+        if self.driftersHalfDevice is not None:
+            self.driftersHalfDevice.gpudata.free()
         self.gpu_ctx = None
             
     def enforceBoundaryConditions(self):
-        if self.boundaryConditions.isPeriodicNorthSouth or self.boundaryConditions.isPeriodicEastWest:
+        """
+        Enforces periodic boundary conditions on drifters that have been moved on 
+        the host. Not needed after drift(), since passiveDrifterKernel wraps the 
+        drifters itself.
+        """
+        if self.periodic_north_south or self.periodic_east_west:
+            self._waitForStagedDownloads()
             self.enforceBoundaryConditionsKernel.prepared_async_call(self.global_size, self.local_size, self.gpu_stream, \
-                                                        np.float32(self.domain_size_x), \
-                                                        np.float32(self.domain_size_y), \
-                                                        np.int32(self.boundaryConditions.isPeriodicNorthSouth()), \
-                                                        np.int32(self.boundaryConditions.isPeriodicEastWest()), \
-                                                        np.int32(self.numDrifters), \
+                                                        self.domain_size_x_float32, \
+                                                        self.domain_size_y_float32, \
+                                                        self.periodic_north_south, \
+                                                        self.periodic_east_west, \
+                                                        self.num_drifters_int32, \
                                                         self.driftersDevice.data.gpudata, \
                                                         self.driftersDevice.pitch)
+            self.hostPositionsOutdated = True
 
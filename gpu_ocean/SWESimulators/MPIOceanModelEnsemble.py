@@ -167,6 +167,10 @@ class MPIOceanModelEnsemble:
         self.t = self.ensemble.modelStep(sub_t, self.comm.rank, update_dt=update_dt)
         return self.t
         
+    def modelStepBatch(self, sub_t, drifter_cells):
+        self.t = self.ensemble.modelStepBatch(sub_t, drifter_cells, self.comm.rank)
+        return self.t
+        
     def updateDt(self):
         self.ensemble.updateDt()
         
@@ -431,13 +435,20 @@ class MPIOceanModelEnsemble:
     def dumpForecastParticleSample(self):
         self.ensemble.dumpForecastParticleSample()
         
-    def getDrifterCells(self, t=None):
+    def getDrifterCells(self, t=None, out=None):
+        """
+        Returns the cell indices of the observed drifters at time t.
+        If out is given, the cells are written into it, so that the same 
+        int32 buffer can be reused between calls.
+        """
         if t is None:
             t = self.t
         drifter_positions = self.observations.get_drifter_position(t, applyDrifterSet=False)
-        drifter_positions[:,0] = np.floor(drifter_positions[:,0]/self.data_args["dx"])
-        drifter_positions[:,1] = np.floor(drifter_positions[:,1]/self.data_args["dy"])
-        return drifter_positions.astype(np.int32)
+        if out is None:
+            out = np.empty(drifter_positions.shape, dtype=np.int32)
+        out[:,0] = np.floor(drifter_positions[:,0]/self.data_args["dx"])
+        out[:,1] = np.floor(drifter_positions[:,1]/self.data_args["dy"])
+        return out
     
     def dumpParticleInfosToFiles(self, prefix="particle_info"):
         """
@@ -24,6 +24,8 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import numpy as np
 import logging
+import pycuda.driver as cuda
+import pycuda.gpuarray
 
 from SWESimulators import CDKLM16, Common, GPUDrifterCollection, BaseOceanStateEnsemble, ParticleInfo, Observation
 
@@ -76,6 +78,12 @@ class OceanModelEnsemble(BaseOceanStateEnsemble.BaseOceanStateEnsemble):
                     
             if self.initialization_variance_factor_ocean_field != 0.0:
                 self.particles[i].perturbState(q0_scale=self.initialization_variance_factor_ocean_field)
+        
+        # Kernel for sampling the ocean state on the GPU, compiled on first use
+        self.sampleOceanStateKernel = None
+        
+        # Per particle buffers for modelStepBatch, (re)allocated when a batch needs more room
+        self.sampleBuffers = [None] * numParticles
             
     
     def attachDrifters(self, drifter_positions):
@@ -98,6 +106,7 @@ class OceanModelEnsemble(BaseOceanStateEnsemble.BaseOceanStateEnsemble):
         for oceanState in self.particles:
             if oceanState is not None:
                 oceanState.cleanUp()
+        self.sampleBuffers = [None] * self.numParticles
     
     
     
@@ -116,6 +125,83 @@ class OceanModelEnsemble(BaseOceanStateEnsemble.BaseOceanStateEnsemble):
             particle += 1
         return self.t
     
+    def modelStepBatch(self, sub_t, drifter_cells, rank):
+        """
+        Function which makes all particles take len(drifter_cells) steps of sub_t in time,
+        and samples the ocean state in the drifter cells (and extra cells) after each step.
+        drifter_cells[j] holds the cells to sample after step j.
+        
+        Each particle runs through all its steps without returning to Python in between.
+        The samples are gathered into a device buffer, which is downloaded once per 
+        particle at the end of the batch, and then added to the particle infos.
+        """
+        num_sub_steps = len(drifter_cells)
+        self.logger.debug("[" + str(rank) + "]: Stepping all particles %d times %f in time", num_sub_steps, sub_t)
+        
+        if self.sampleOceanStateKernel is None:
+            observation_kernels = self.gpu_ctx.get_kernel("observationKernels.cu", defines={})
+            self.sampleOceanStateKernel = observation_kernels.get_function("sampleOceanState")
+            self.sampleOceanStateKernel.prepare("iiiiiPiPiPiPP")
+        
+        for i, p in enumerate(self.particles):
+            extraCells = self.particleInfos[i].extraCells
+            num_drifter_cells = drifter_cells[0].shape[0]
+            num_cells = num_drifter_cells + self.particleInfos[i].get_num_extra_cells()
+            cells_host, cells_gpu, samples_host, samples_gpu = self._getSampleBuffers(i, num_sub_steps, num_cells)
+            
+            # All cells to sample, for all sub steps, in one upload
+            cells = cells_host[:num_sub_steps]
+            cells[:, :num_drifter_cells, :] = drifter_cells
+            if extraCells is not None:
+                cells[:, num_drifter_cells:, :] = extraCells
+            cells_gpu[:num_sub_steps].set_async(cells, stream=p.gpu_stream)
+            sample_times = np.empty(num_sub_steps)
+            
+            local_size = (64, 1, 1)
+            global_size = ((num_cells + local_size[0] - 1)//local_size[0], 1)
+            
+            for j in range(num_sub_steps):
+                self.t = p.step(sub_t)
+                sample_times[j] = self.t
+                self.sampleOceanStateKernel.prepared_async_call(global_size, local_size, p.gpu_stream, \
+                                                        num_cells, p.nx, p.ny, \
+                                                        np.int32(p.interior_domain_indices[3]), \
+                                                        np.int32(p.interior_domain_indices[2]), \
+                                                        p.gpu_data.h0.data.gpudata, p.gpu_data.h0.pitch, \
+                                                        p.gpu_data.hu0.data.gpudata, p.gpu_data.hu0.pitch, \
+                                                        p.gpu_data.hv0.data.gpudata, p.gpu_data.hv0.pitch, \
+                                                        cells_gpu[j].gpudata, \
+                                                        samples_gpu[j].gpudata)
+            
+            samples_gpu[:num_sub_steps].get_async(stream=p.gpu_stream, ary=samples_host[:num_sub_steps])
+            p.gpu_stream.synchronize()
+            samples = samples_host[:num_sub_steps].astype(np.float64)
+            
+            for j in range(num_sub_steps):
+                extra_sample = None
+                if extraCells is not None:
+                    extra_sample = samples[j, num_drifter_cells:, :]
+                self.particleInfos[i].add_state_sample(sample_times[j], \
+                                                       samples[j, :num_drifter_cells, :], \
+                                                       extra_sample)
+        return self.t
+    
+    def _getSampleBuffers(self, particle, num_sub_steps, num_cells):
+        """
+        Returns the (pinned host, device) buffers for the sampled cells and the samples
+        of the given particle, with room for at least num_sub_steps steps of num_cells cells.
+        The buffers are kept between batches, and only replaced when a batch needs more room.
+        """
+        buffers = self.sampleBuffers[particle]
+        if buffers is None or buffers[0].shape[0] < num_sub_steps or buffers[0].shape[1] != num_cells:
+            cells_host = cuda.pagelocked_empty((num_sub_steps, num_cells, 2), dtype=np.int32)
+            cells_gpu = pycuda.gpuarray.empty((num_sub_steps, num_cells, 2), dtype=np.int32)
+            samples_host = cuda.pagelocked_empty((num_sub_steps, num_cells, 3), dtype=np.float32)
+            samples_gpu = pycuda.gpuarray.empty((num_sub_steps, num_cells, 3), dtype=np.float32)
+            buffers = (cells_host, cells_gpu, samples_host, samples_gpu)
+            self.sampleBuffers[particle] = buffers
+        return buffers
+    
     def updateDt(self):
         """
         Function that updates dt for all particles.
@@ -374,9 +374,12 @@ class OceanNoiseEnsemble(BaseOceanStateEnsemble.BaseOceanStateEnsemble):
         """
         Observing the drifters in all particles
         """
+        # Issue all downloads before waiting for any of them
+        downloads = [self.particles[p].drifters.getDrifterPositionsAsync() \
+                     for p in range(self.getNumParticles())]
         drifterPositions = np.empty((self.getNumParticles(), self.driftersPerOceanModel, 2))
         for p in range(self.getNumParticles()):
-            drifterPositions[p,:,:] = self.particles[p].drifters.getDrifterPositions()
+            drifterPositions[p,:,:] = downloads[p].sync()
         return drifterPositions
     
 
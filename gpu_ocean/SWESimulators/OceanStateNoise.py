@@ -26,6 +26,7 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 from matplotlib import pyplot as plt
 import numpy as np
+from scipy.ndimage import correlate
 
 import pycuda.driver as cuda
 from pycuda.curandom import XORWOWRandomNumberGenerator
@@ -75,8 +76,11 @@ class OceanStateNoise(object):
         
         # Make sure that all variables initialized within ifs are defined
         self.random_numbers = None
+        self.next_random_numbers = None
         self.rng = None
+        self.host_rng = None
         self.seed = None
+        self.next_seed = None
         self.host_seed = None
         
         self.gpu_ctx = gpu_ctx
@@ -128,18 +132,42 @@ class OceanStateNoise(object):
         # Since normal distributed numbers are generated in pairs, we need to store half the number of
         # of seed values compared to the number of random numbers.
         self.seed_ny = np.int32(self.rand_ny)
-        self.seed_nx = np.int32(np.ceil(self.rand_nx/2))
+        self.seed_nx = np.int32(self._numBlocks(self.rand_nx, 2))
+        
+        # All (block_width, block_height) pairs generated by one GPU block share a seed,
+        # from which each thread skips ahead to its own pair. Only one seed per block is stored.
+        self.block_seed_nx = np.int32(self._numBlocks(self.seed_nx, block_width))
+        self.block_seed_ny = np.int32(self._numBlocks(self.seed_ny, block_height))
+        
+        # Rows that are a multiple of 64 elements give power-of-two strides, which map
+        # consecutive rows onto the same memory channels. The GPU buffers for seeds and
+        # random numbers are then padded, while rand_nx and block_seed_nx remain the logical sizes.
+        self.seed_alloc_nx = self._paddedWidth(self.block_seed_nx)
+        self.rand_alloc_nx = self._paddedWidth(self.rand_nx)
 
         # Generate seed:
         self.floatMax = 2147483648.0
         if self.use_lcg:
-            self.host_seed = self.random_state.rand(self.seed_ny, self.seed_nx)*self.floatMax
-            self.host_seed = self.host_seed.astype(np.uint64, order='C')
+            self.host_seed = self._generateHostSeed()
+            
+            # LCG skip-ahead constants for the CPU version: from the block seed to the seed
+            # of each pair, and from the block seed to the next block seed
+            thread_id = np.arange(block_width*block_height, dtype=np.uint32).reshape(block_height, block_width)
+            thread_skip_a, thread_skip_c = self._lcgSkipConstants(2*thread_id)
+            self.lcg_thread_skip_a = np.tile(thread_skip_a, (self.block_seed_ny, self.block_seed_nx))[:self.seed_ny, :self.seed_nx]
+            self.lcg_thread_skip_c = np.tile(thread_skip_c, (self.block_seed_ny, self.block_seed_nx))[:self.seed_ny, :self.seed_nx]
+            self.lcg_block_skip_a, self.lcg_block_skip_c = self._lcgSkipConstants(2*block_width*block_height)
         
         if not self.use_lcg:
             self.rng = XORWOWRandomNumberGenerator()
+            # The CPU versions do not need to reproduce XORWOW, and use a 
+            # counter-based generator that fills the whole buffer at once
+            self.host_rng = np.random.Generator(np.random.Philox(self.random_state.randint(2147483647)))
         else:
-            self.seed = Common.CUDAArray2D(gpu_stream, self.seed_nx, self.seed_ny, 0, 0, self.host_seed, double_precision=True, integers=True)
+            padded_seed = self._padColumns(self.host_seed, self.seed_alloc_nx)
+            self.seed = Common.CUDAArray2D(gpu_stream, self.seed_alloc_nx, self.block_seed_ny, 0, 0, padded_seed, double_precision=True, integers=True)
+            # Second seed buffer, so that SOARFused can read the current seeds while writing the next
+            self.next_seed = Common.CUDAArray2D(gpu_stream, self.seed_alloc_nx, self.block_seed_ny, 0, 0, padded_seed, double_precision=True, integers=True)
         
         # Constants for the SOAR function:
         self.soar_q0 = np.float32(self.dx/100000)
@@ -150,13 +178,50 @@ class OceanStateNoise(object):
         if soar_L is not None:
             self.soar_L = np.float32(soar_L)
         
+        # The SOAR stencil is translation invariant, so the CPU implementation
+        # evaluates its (2*cutoff+1)^2 weights once
+        soar_offsets = np.arange(-self.cutoff, self.cutoff+1)
+        soar_dx2 = (self.coarse_dx*soar_offsets)**2
+        soar_dy2 = (self.coarse_dy*soar_offsets)**2
+        soar_dist = np.sqrt(soar_dx2[None, :] + soar_dy2[:, None])
+        self.soar_kernel_host = (self.soar_q0*(1.0 + soar_dist/self.soar_L)*np.exp(-soar_dist/self.soar_L)).astype(np.float32)
+        
         # Allocate memory for random numbers (xi)
         self.random_numbers_host = np.zeros((self.rand_ny, self.rand_nx), dtype=np.float32, order='C')
-        self.random_numbers = Common.CUDAArray2D(self.gpu_stream, self.rand_nx, self.rand_ny, 0, 0, self.random_numbers_host)
+        self.random_numbers = Common.CUDAArray2D(self.gpu_stream, self.rand_alloc_nx, self.rand_ny, 0, 0, 
+                                                 self._padColumns(self.random_numbers_host, self.rand_alloc_nx))
+        
+        # Page-locked staging buffers, so that downloads of random numbers and seeds
+        # are DMA'd directly instead of through a driver-internal pinned copy
+        self.random_numbers_staging = cuda.pagelocked_zeros((self.rand_ny, self.rand_alloc_nx), dtype=np.float32, 
+                                                            mem_flags=cuda.host_alloc_flags.PORTABLE)
+        self.seed_staging = None
+        if self.use_lcg:
+            self.seed_staging = cuda.pagelocked_zeros((self.block_seed_ny, self.seed_alloc_nx), dtype=np.uint32, 
+                                                      mem_flags=cuda.host_alloc_flags.PORTABLE)
+        
+        # Work buffers for the CPU version of the SOAR stencil, with 2 + cutoff ghost cells.
+        # Single precision, as on the GPU.
+        self.local_xi_host = np.zeros((self.coarse_ny + 2*(2+self.cutoff), self.coarse_nx + 2*(2+self.cutoff)), dtype=np.float32)
+        self.Qxi_host = np.zeros_like(self.local_xi_host)
         
         # Allocate a second buffer for random numbers (nu)
         self.perpendicular_random_numbers_host = np.zeros((self.rand_ny, self.rand_nx), dtype=np.float32, order='C')
-        self.perpendicular_random_numbers = Common.CUDAArray2D(self.gpu_stream, self.rand_nx, self.rand_ny, 0, 0, self.random_numbers_host)
+        self.perpendicular_random_numbers = Common.CUDAArray2D(self.gpu_stream, self.rand_alloc_nx, self.rand_ny, 0, 0, 
+                                                               self._padColumns(self.perpendicular_random_numbers_host, self.rand_alloc_nx))
+        
+        # Without LCG, the random field for the next perturbOceanState is generated ahead 
+        # of time into a second buffer on a separate stream, so that it overlaps with the 
+        # SOAR kernel consuming the current one (see _generateNextRandomNumbers)
+        self.rng_stream = None
+        self.has_next_random_numbers = False
+        if not self.use_lcg:
+            self.next_random_numbers = Common.CUDAArray2D(self.gpu_stream, self.rand_alloc_nx, self.rand_ny, 0, 0, 
+                                                          self._padColumns(self.random_numbers_host, self.rand_alloc_nx))
+            self.rng_stream = cuda.Stream()
+            self.next_random_numbers_ready = cuda.Event(cuda.event_flags.DISABLE_TIMING)
+            self.random_numbers_consumed = cuda.Event(cuda.event_flags.DISABLE_TIMING)
+            self.random_numbers_consumed_default_stream = cuda.Event(cuda.event_flags.DISABLE_TIMING)
         
         
         # Allocate memory for coarse buffer if needed
@@ -172,7 +237,10 @@ class OceanStateNoise(object):
        
         # Generate kernels
         self.kernels = gpu_ctx.get_kernel("ocean_noise.cu", \
-                                          defines={'block_width': block_width, 'block_height': block_height},
+                                          defines={'block_width': block_width, 'block_height': block_height,
+                                                   'soar_cutoff': self.cutoff,
+                                                   'SOAR_DX': self.coarse_dx, 'SOAR_DY': self.coarse_dy, 
+                                                   'SOAR_L': self.soar_L},
                                           compile_args={
                                               'options': ["--use_fast_math",
                                                           "--maxrregcount=32"]
@@ -184,10 +252,10 @@ class OceanStateNoise(object):
         # Get CUDA functions and define data types for prepared_{async_}call()
         # Generate kernels
         self.squareSumKernel = self.reduction_kernels.get_function("squareSum")
-        self.squareSumKernel.prepare("iiPP")
+        self.squareSumKernel.prepare("iiPiP")
                 
         self.squareSumDoubleKernel = self.reduction_kernels.get_function("squareSumDouble")
-        self.squareSumDoubleKernel.prepare("iiPPP")
+        self.squareSumDoubleKernel.prepare("iiPiPiP")
         
         self.makePerpendicularKernel = self.kernels.get_function("makePerpendicular")
         self.makePerpendicularKernel.prepare("iiPiPiP")
@@ -201,7 +269,16 @@ class OceanStateNoise(object):
             self.normalDistributionKernel.prepare("iiiPiPi")
         
         self.soarKernel = self.kernels.get_function("SOAR")
-        self.soarKernel.prepare("iifffffiiPiPii")
+        self.soarKernel.prepare("iiffiiPiPii")
+        
+        self.soarFusedKernel = None
+        if self.use_lcg:
+            self.soarFusedKernel = self.kernels.get_function("SOARFused")
+            self.soarFusedKernel.prepare("iiffiiiiiPiPiPiPi")
+        
+        # Upload the SOAR weights (without the amplitude q0) to constant memory
+        soar_weights_ptr, _ = self.kernels.get_global("soar_weights")
+        cuda.memcpy_htod(soar_weights_ptr, (self.soar_kernel_host/self.soar_q0).astype(np.float32))
         
         self.geostrophicBalanceKernel = self.kernels.get_function("geostrophicBalance")
         self.geostrophicBalanceKernel.prepare("iiffiiffffPiPiPiPiPif")
@@ -217,28 +294,28 @@ class OceanStateNoise(object):
         
         # Launch one thread for each seed, which in turns generates two iid N(0,1)
         self.global_size_random_numbers = ( \
-                       int(np.ceil(self.seed_nx / float(self.local_size[0]))), \
-                       int(np.ceil(self.seed_ny / float(self.local_size[1]))) \
+                       self._numBlocks(self.seed_nx, self.local_size[0]), \
+                       self._numBlocks(self.seed_ny, self.local_size[1]) \
                      ) 
         
         # Launch on thread for each random number (in order to create perpendicular random numbers)
         self.global_size_perpendicular = ( \
-                      int(np.ceil(self.rand_nx / float(self.local_size[0]))), \
-                      int(np.ceil(self.rand_ny / float(self.local_size[1]))) \
+                      self._numBlocks(self.rand_nx, self.local_size[0]), \
+                      self._numBlocks(self.rand_ny, self.local_size[1]) \
                      )
         
         
         # Launch one thread per SOAR-correlated result - need to write to two ghost 
         # cells in order to do bicubic interpolation based on the result
         self.global_size_SOAR = ( \
-                     int(np.ceil( (self.coarse_nx+4)/float(self.local_size[0]))), \
-                     int(np.ceil( (self.coarse_ny+4)/float(self.local_size[1]))) \
+                     self._numBlocks(self.coarse_nx+4, self.local_size[0]), \
+                     self._numBlocks(self.coarse_ny+4, self.local_size[1]) \
                     )
         
         # One thread per resulting perturbed grid cell
         self.global_size_geo_balance = ( \
-                    int(np.ceil( (self.nx)/float(self.local_size[0]))), \
-                    int(np.ceil( (self.ny)/float(self.local_size[1]))) \
+                    self._numBlocks(self.nx, self.local_size[0]), \
+                    self._numBlocks(self.ny, self.local_size[1]) \
                    )
         
         # Texture for coriolis field
@@ -283,8 +360,12 @@ class OceanStateNoise(object):
             self.rng = None
         if self.seed is not None:
             self.seed.release()
+        if self.next_seed is not None:
+            self.next_seed.release()
         if self.random_numbers is not None:
             self.random_numbers.release()
+        if self.next_random_numbers is not None:
+            self.next_random_numbers.release()
         if self.perpendicular_random_numbers is not None:
             self.perpendicular_random_numbers.release()
         if self.reduction_buffer is not None:
@@ -308,25 +389,83 @@ class OceanStateNoise(object):
                    use_lcg=use_lcg,
                    block_width=block_width, block_height=block_height)
 
+    def _generateHostSeed(self):
+        """
+        Draws a new (block_seed_ny, block_seed_nx) array of 31-bit LCG seeds, stored as uint32
+        both on the host and on the GPU.
+        """
+        return (self.random_state.rand(self.block_seed_ny, self.block_seed_nx)*self.floatMax).astype(np.uint32, order='C')
+    
+    @staticmethod
+    def _lcgSkipConstants(k):
+        """
+        Multiplier and increment of the LCG advanced k steps, so that the seed after
+        k steps is (a*seed + c) & 0x7fffffff. Same algorithm as lcgSkip on the GPU.
+        """
+        k = np.array(k, dtype=np.uint32, ndmin=1)
+        acc_a = np.ones_like(k)
+        acc_c = np.zeros_like(k)
+        cur_a = np.full_like(k, 1103515245)
+        cur_c = np.full_like(k, 12345)
+        while np.any(k > 0):
+            odd = (k & 1) == 1
+            acc_c = np.where(odd, acc_c*cur_a + cur_c, acc_c)
+            acc_a = np.where(odd, acc_a*cur_a, acc_a)
+            cur_c = (cur_a + np.uint32(1))*cur_c
+            cur_a = cur_a*cur_a
+            k = k >> np.uint32(1)
+        return acc_a, acc_c
+    
+    @staticmethod
+    def _numBlocks(n, block_size):
+        """
+        Number of blocks of block_size needed to cover n elements, in integer arithmetic
+        """
+        return (int(n) + block_size - 1)//block_size
+    
+    @staticmethod
+    def _paddedWidth(nx):
+        """
+        Number of elements to allocate per row for a buffer with nx elements per row.
+        Padding with 32 elements avoids power-of-two strides, but keeps the rows aligned.
+        """
+        if nx % 64 == 0:
+            return np.int32(nx + 32)
+        return np.int32(nx)
+    
+    @staticmethod
+    def _padColumns(data, alloc_nx):
+        """
+        Pads data with zero columns up to alloc_nx columns, for upload to a padded buffer
+        """
+        return np.pad(data, ((0, 0), (0, alloc_nx - data.shape[1])), mode='constant')
+    
     def getSeed(self):
         assert(self.use_lcg), "getSeed is only valid if LCG is used as pseudo-random generator."
         
-        return self.seed.download(self.gpu_stream)
+        return self._downloadStaged(self.seed, self.seed_staging, self.block_seed_nx).copy()
     
     def resetSeed(self):
         assert(self.use_lcg), "resetSeed is only valid if LCG is used as pseudo-random generator."
 
         # Generate seed:
-        self.floatMax = 2147483648.0
-        self.host_seed = self.random_state.rand(self.seed_ny, self.seed_nx)*self.floatMax
-        self.host_seed = self.host_seed.astype(np.uint64, order='C')
-        self.seed.upload(self.gpu_stream, self.host_seed)
+        self.host_seed = self._generateHostSeed()
+        self.seed.upload(self.gpu_stream, self._padColumns(self.host_seed, self.seed_alloc_nx))
 
+    def _downloadStaged(self, buffer, staging, nx):
+        """
+        Downloads buffer through the given page-locked staging array, and returns
+        a view of the first nx columns. The view is overwritten by the next download.
+        """
+        buffer.data.get_async(stream=self.gpu_stream, ary=staging)
+        self.gpu_stream.synchronize()
+        return staging[:, :nx]
+    
     def getRandomNumbers(self):
-        return self.random_numbers.download(self.gpu_stream)
+        return self._downloadStaged(self.random_numbers, self.random_numbers_staging, self.rand_nx).copy()
     
     def getPerpendicularRandomNumbers(self):
-        return self.perpendicular_random_numbers.download(self.gpu_stream)
+        return self._downloadStaged(self.perpendicular_random_numbers, self.random_numbers_staging, self.rand_nx).copy()
     
     def getCoarseBuffer(self):
         return self.coarse_buffer.download(self.gpu_stream)
@@ -336,6 +475,7 @@ class OceanStateNoise(object):
     
     def generateNormalDistribution(self):
         if not self.use_lcg:
+            self._waitForNextRandomNumbers(self.gpu_stream)
             self.rng.fill_normal(self.random_numbers.data, stream=self.gpu_stream)
         else:
             self.normalDistributionKernel.prepared_async_call(self.global_size_random_numbers, self.local_size, self.gpu_stream,
@@ -346,6 +486,7 @@ class OceanStateNoise(object):
     
     def generateNormalDistributionPerpendicular(self):
         if not self.use_lcg:
+            self._waitForNextRandomNumbers(self.gpu_stream)
             self.rng.fill_normal(self.perpendicular_random_numbers.data, stream=self.gpu_stream)
         else:
             self.normalDistributionKernel.prepared_async_call(self.global_size_random_numbers, self.local_size, self.gpu_stream,
@@ -357,6 +498,7 @@ class OceanStateNoise(object):
     def generateUniformDistribution(self):
         # Call kernel -> new random numbers
         if not self.use_lcg:
+            self._waitForNextRandomNumbers(self.gpu_stream)
             self.rng.fill_uniform(self.random_numbers.data, stream=self.gpu_stream)
         else:
             self.uniformDistributionKernel.prepared_async_call(self.global_size_random_numbers, self.local_size, self.gpu_stream,
@@ -415,54 +557,67 @@ class OceanStateNoise(object):
         if stream is None:
             stream = self.gpu_stream
         
-        if update_random_field:
-            # Need to update the random field, requiering a global sync
-            self.generateNormalDistribution()
-        
-        soar_q0 = np.float32(self.soar_q0 * q0_scale)
+        soar_q0 = self.soar_q0 * q0_scale
         
         offset_i, offset_j = self._obtain_coarse_grid_offset(align_with_cell_i, align_with_cell_j)
         
         # Generate the SOAR field on the coarse grid
-        
-        
-        self.soarKernel.prepared_async_call(self.global_size_SOAR, self.local_size, stream,
-                                            self.coarse_nx, self.coarse_ny,
-                                            self.coarse_dx, self.coarse_dy,
+        if update_random_field and self.use_lcg:
+            # Generate the random field on the fly, and swap to the updated seeds
+            self.soarFusedKernel.prepared_async_call(self.global_size_SOAR, self.local_size, stream,
+                                                     self.coarse_nx, self.coarse_ny,
+                                                     soar_q0,
+                                                     perturbation_scale,
 
-                                            soar_q0, self.soar_L,
-                                            np.float32(perturbation_scale),
-                                            
-                                            self.periodicNorthSouth, self.periodicEastWest,
-                                            self.random_numbers.data.gpudata, self.random_numbers.pitch,
-                                            self.coarse_buffer.data.gpudata, self.coarse_buffer.pitch,
-                                            np.int32(0))
-        if perpendicular_scale > 0:
+                                                     self.periodicNorthSouth, self.periodicEastWest,
+                                                     self.seed_nx, self.seed_ny,
+                                                     self.rand_nx,
+                                                     self.seed.data.gpudata, self.seed.pitch,
+                                                     self.next_seed.data.gpudata, self.next_seed.pitch,
+                                                     self.random_numbers.data.gpudata, self.random_numbers.pitch,
+                                                     self.coarse_buffer.data.gpudata, self.coarse_buffer.pitch)
+            self.seed, self.next_seed = self.next_seed, self.seed
+        else:
+            if update_random_field:
+                # Use the random field generated ahead of time if there is one
+                self._swapInNextRandomNumbers(stream)
+            
             self.soarKernel.prepared_async_call(self.global_size_SOAR, self.local_size, stream,
                                                 self.coarse_nx, self.coarse_ny,
-                                                self.coarse_dx, self.coarse_dy,
+                                                soar_q0,
+                                                perturbation_scale,
 
-                                                soar_q0, self.soar_L,
-                                                np.float32(perpendicular_scale),
+                                                self.periodicNorthSouth, self.periodicEastWest,
+                                                self.random_numbers.data.gpudata, self.random_numbers.pitch,
+                                                self.coarse_buffer.data.gpudata, self.coarse_buffer.pitch,
+                                                0)
+            
+            if update_random_field:
+                self._generateNextRandomNumbers(stream)
+        if perpendicular_scale > 0:
+            self.soarKernel.prepared_async_call(self.global_size_SOAR, self.local_size, stream,
+                                                self.coarse_nx, self.coarse_ny,
+                                                soar_q0,
+                                                perpendicular_scale,
 
                                                 self.periodicNorthSouth, self.periodicEastWest,
                                                 self.perpendicular_random_numbers.data.gpudata, self.perpendicular_random_numbers.pitch,
                                                 self.coarse_buffer.data.gpudata, self.coarse_buffer.pitch,
-                                                np.int32(1))
+                                                1)
         
         if self.interpolation_factor > 1:
             self.bicubicInterpolationKernel.prepared_async_call(self.global_size_geo_balance, self.local_size, stream,
                                                                 self.nx, self.ny, 
-                                                                np.int32(ghost_cells_x), np.int32(ghost_cells_y),
+                                                                ghost_cells_x, ghost_cells_y,
                                                                 self.dx, self.dy,
                                                                 
                                                                 self.coarse_nx, self.coarse_ny,
-                                                                np.int32(ghost_cells_x), np.int32(ghost_cells_y),
+                                                                ghost_cells_x, ghost_cells_y,
                                                                 self.coarse_dx, self.coarse_dy,
-                                                                np.int32(offset_i), np.int32(offset_j),
+                                                                offset_i, offset_j,
                                                                 
-                                                                np.float32(g), np.float32(f),
-                                                                np.float32(beta), np.float32(y0_reference_cell),
+                                                                g, f,
+                                                                beta, y0_reference_cell,
                                                                 
                                                                 self.coarse_buffer.data.gpudata, self.coarse_buffer.pitch,
                                                                 eta.data.gpudata, eta.pitch,
@@ -475,10 +630,10 @@ class OceanStateNoise(object):
             self.geostrophicBalanceKernel.prepared_async_call(self.global_size_geo_balance, self.local_size, stream,
                                                               self.nx, self.ny,
                                                               self.dx, self.dy,
-                                                              np.int32(ghost_cells_x), np.int32(ghost_cells_y),
+                                                              ghost_cells_x, ghost_cells_y,
 
-                                                              np.float32(g), np.float32(f),
-                                                              np.float32(beta), np.float32(y0_reference_cell),
+                                                              g, f,
+                                                              beta, y0_reference_cell,
 
                                                               self.coarse_buffer.data.gpudata, self.coarse_buffer.pitch,
                                                               eta.data.gpudata, eta.pitch,
@@ -487,6 +642,41 @@ class OceanStateNoise(object):
                                                               H.data.gpudata, H.pitch,
                                                               land_mask_value)
     
+    def _waitForNextRandomNumbers(self, stream):
+        """
+        Makes stream wait for the random field being generated ahead of time, as the 
+        XORWOW generator state can not be used by two streams at once.
+        """
+        if self.has_next_random_numbers:
+            stream.wait_for_event(self.next_random_numbers_ready)
+    
+    def _swapInNextRandomNumbers(self, stream):
+        """
+        Makes the random field generated ahead of time the current one, or generates
+        a new current random field on stream if there is none.
+        """
+        if self.has_next_random_numbers:
+            stream.wait_for_event(self.next_random_numbers_ready)
+            self.random_numbers, self.next_random_numbers = self.next_random_numbers, self.random_numbers
+            self.has_next_random_numbers = False
+        else:
+            self.rng.fill_normal(self.random_numbers.data, stream=stream)
+    
+    def _generateNextRandomNumbers(self, stream):
+        """
+        Starts generating the random field for the next perturbation on rng_stream.
+        The buffer it is written to was the current random field until the last swap, 
+        so the generation waits for the work already queued on stream and gpu_stream.
+        """
+        self.random_numbers_consumed.record(stream)
+        self.rng_stream.wait_for_event(self.random_numbers_consumed)
+        self.random_numbers_consumed_default_stream.record(self.gpu_stream)
+        self.rng_stream.wait_for_event(self.random_numbers_consumed_default_stream)
+        
+        self.rng.fill_normal(self.next_random_numbers.data, stream=self.rng_stream)
+        self.next_random_numbers_ready.record(self.rng_stream)
+        self.has_next_random_numbers = True
+    
     def _obtain_coarse_grid_offset(self, fine_index_i, fine_index_j):
         
         default_offset = self.interpolation_factor//2
@@ -513,7 +703,7 @@ class OceanStateNoise(object):
                                                  self.local_size_reductions, 
                                                  self.gpu_stream,
                                                  self.rand_nx, self.rand_ny,
-                                                 self.random_numbers.data.gpudata,
+                                                 self.random_numbers.data.gpudata, self.random_numbers.pitch,
                                                  self.reduction_buffer.data.gpudata)
         return self.getReductionBuffer()[0,0]
     
@@ -527,8 +717,8 @@ class OceanStateNoise(object):
                                                        self.local_size_reductions, 
                                                        self.gpu_stream,
                                                        self.rand_nx, self.rand_ny,
-                                                       self.random_numbers.data.gpudata,
-                                                       self.perpendicular_random_numbers.data.gpudata,
+                                                       self.random_numbers.data.gpudata, self.random_numbers.pitch,
+                                                       self.perpendicular_random_numbers.data.gpudata, self.perpendicular_random_numbers.pitch,
                                                        self.reduction_buffer.data.gpudata)
         
     def _makePerpendicular(self):
@@ -583,7 +773,8 @@ class OceanStateNoise(object):
         """
         # Call CPU utility function
         if use_existing_GPU_random_numbers:
-            self.random_numbers_host = self.getRandomNumbers()
+            np.copyto(self.random_numbers_host, 
+                      self._downloadStaged(self.random_numbers, self.random_numbers_staging, self.rand_nx))
         else:
             self.generateNormalDistributionCPU()
         d_eta = self._applyQ_CPU()
@@ -610,7 +801,8 @@ class OceanStateNoise(object):
         """
         # Call CPU utility function
         if use_existing_GPU_random_numbers:
-            self.random_numbers_host = self.getRandomNumbers()
+            np.copyto(self.random_numbers_host, 
+                      self._downloadStaged(self.random_numbers, self.random_numbers_staging, self.rand_nx))
         elif not use_existing_CPU_random_numbers:
             self.generateNormalDistributionCPU()
         
@@ -634,12 +826,18 @@ class OceanStateNoise(object):
     # ------------------------------
     
     def _lcg(self, seed):
-        modulo = np.uint64(2147483647)
-        seed = np.uint64(((seed*1103515245) + 12345) % modulo) #0x7fffffff
+        """
+        ANSI C linear congruential generator, applied elementwise so that
+        seed can be either a scalar or the full seed array.
+        """
+        # The 31-bit state is kept in uint32, where the product wraps modulo 2^32
+        # before the mask reduces it modulo 2^31 - exactly as on the GPU
+        mask = np.uint32(0x7fffffff)
+        seed = ((np.uint32(seed)*np.uint32(1103515245)) + np.uint32(12345)) & mask
         return seed / 2147483648.0, seed
     
     def _boxMuller(self, seed_in):
-        seed = np.uint64(seed_in)
+        seed = np.uint32(seed_in)
         u1, seed = self._lcg(seed)
         u2, seed = self._lcg(seed)
         r = np.sqrt(-2.0*np.log(u1))
@@ -654,51 +852,45 @@ class OceanStateNoise(object):
         normalDist: Boolean parameter. 
             If True, the random numbers are from N(0,1)
             If False, the random numbers are from U[0,1]
+        Only random_numbers_host is updated, never the GPU buffer. Without LCG,
+        the numbers come from a host Philox generator that is independent of 
+        the GPU generator, so mixing CPU and GPU perturbations on the same object
+        gives different fields. Use use_existing_GPU_random_numbers=True in the
+        CPU perturbations to reproduce a GPU perturbation.
         """
+        # Callers such as IEWPFOcean.applyKalmanGain_CPU may have rebound 
+        # random_numbers_host to an array of another type, which cannot be 
+        # written into in place
+        if self.random_numbers_host.dtype != np.float32 or \
+           self.random_numbers_host.shape != (self.rand_ny, self.rand_nx) or \
+           not self.random_numbers_host.flags['C_CONTIGUOUS']:
+            self.random_numbers_host = np.zeros((self.rand_ny, self.rand_nx), dtype=np.float32, order='C')
+        
         if not self.use_lcg:
             if normalDist:
-                self.generateNormalDistribution()
+                self.host_rng.standard_normal(dtype=np.float32, out=self.random_numbers_host)
             else:
-                self.generateUniformDistribution()
-            self.random_numbers_host = self.getRandomNumbers()
+                self.host_rng.random(dtype=np.float32, out=self.random_numbers_host)
             return
         
-        #(ny, nx) = seed.shape
-        #(domain_ny, domain_nx) = random.shape
-        b_dim_x = self.local_size[0]
-        b_dim_y = self.local_size[1]
-        blocks_x = self.global_size_random_numbers[0]
-        blocks_y = self.global_size_random_numbers[1]
-        for by in range(blocks_y):
-            for bx in range(blocks_x):
-                for j in range(b_dim_y):
-                    for i in range(b_dim_x):
-
-                        ## Content of kernel:
-                        y = b_dim_y*by + j # thread_id
-                        x = b_dim_x*bx + i # thread_id
-                        if (x < self.seed_nx and y < self.seed_ny):
-                            n1, n2 = 0.0, 0.0
-                            if normalDist:
-                                n1, n2, self.host_seed[y,x]   = self._boxMuller(self.host_seed[y,x])
-                            else:
-                                n1, self.host_seed[y,x] = self._lcg(self.host_seed[y,x])
-                                n2, self.host_seed[y,x] = self._lcg(self.host_seed[y,x])
-                                
-                            if x*2 + 1 < self.rand_nx:
-                                self.random_numbers_host[y, x*2  ] = n1
-                                self.random_numbers_host[y, x*2+1] = n2
-                            elif x*2 == self.rand_nx:
-                                self.random_numbers_host[y, x*2] = n1
-    
-    def _SOAR_Q_CPU(self, a_x, a_y, b_x, b_y):
-        """
-        CPU implementation of a SOAR covariance function between grid points
-        (a_x, a_y) and (b_x, b_y)
-        """
-        dist = np.sqrt(  self.coarse_dx*self.coarse_dx*(a_x - b_x)**2  
-                       + self.coarse_dy*self.coarse_dy*(a_y - b_y)**2 )
-        return self.soar_q0*(1.0 + dist/self.soar_L)*np.exp(-dist/self.soar_L)
+        # Same as the kernel, but with the whole seed grid processed at once:
+        # each pair of random numbers at columns (2x, 2x+1) skips ahead from its block seed,
+        # and the block seeds are then advanced past all pairs in the block
+        mask = np.uint32(0x7fffffff)
+        block_seed = np.repeat(np.repeat(self.host_seed, self.local_size[1], axis=0), self.local_size[0], axis=1)
+        seed = (self.lcg_thread_skip_a*block_seed[:self.seed_ny, :self.seed_nx] + self.lcg_thread_skip_c) & mask
+        if normalDist:
+            n1, n2, seed = self._boxMuller(seed)
+        else:
+            n1, seed = self._lcg(seed)
+            n2, seed = self._lcg(seed)
+        self.host_seed[:, :] = (self.lcg_block_skip_a*self.host_seed + self.lcg_block_skip_c) & mask
+        
+        # As in the kernel, only complete pairs are written, so an odd 
+        # rand_nx leaves the last column untouched
+        num_pairs = self.rand_nx//2
+        self.random_numbers_host[:, 0:2*num_pairs:2] = n1[:, :num_pairs]
+        self.random_numbers_host[:, 1:2*num_pairs:2] = n2[:, :num_pairs]
     
     def _applyQ_CPU(self, perturbation_scale=1):
         #xi, dx=1, dy=1, q0=0.1, L=1, cutoff=5):
@@ -708,50 +900,41 @@ class OceanStateNoise(object):
         
         The resulting size is (coarse_nx+4, coarse_ny+4), as two ghost cells are required to 
         do bicubic interpolation of the result.
+        The result is a view into a work buffer, and is overwritten by the next call.
+        Use _obtainOceanPerturbations_CPU to get a perturbation that can be kept.
         """
                         
-        # Assume in a GPU setting - we read xi into shared memory with ghostcells
-        # Additional cutoff number of ghost cells required to calculate SOAR contribution
-        ny_halo = int(self.coarse_ny + (2 + self.cutoff)*2)
-        nx_halo = int(self.coarse_nx + (2 + self.cutoff)*2)
-        local_xi = np.zeros((ny_halo, nx_halo))
-        for j in range(ny_halo):
-            global_j = j
-            if self.periodicNorthSouth:
-                global_j = (j - self.cutoff - 2) % self.rand_ny
-            for i in range(nx_halo):
-                global_i = i
-                if self.periodicEastWest:
-                    global_i = (i - self.cutoff - 2) % self.rand_nx
-                local_xi[j,i] = self.random_numbers_host[global_j, global_i]
-                
-        # Sync threads
-        
-        # Allocate output buffer
-        Qxi = np.zeros((self.coarse_ny+4, self.coarse_nx+4))
-        for a_y in range(self.coarse_ny+4):
-            for a_x in range(self.coarse_nx+4):
-                # This is a OpenCL thread (a_x, a_y)
-                local_a_x = a_x + self.cutoff
-                local_a_y = a_y + self.cutoff
-                
-                #############
-                #Qxi[a_y, a_x] = local_xi[local_a_y, local_a_x]
-                #continue
-                #############
-                
-                
-                start_b_y = local_a_y - self.cutoff
-                end_b_y =  local_a_y + self.cutoff+1
-                start_b_x = local_a_x - self.cutoff
-                end_b_x =  local_a_x + self.cutoff+1
-
-                Qx = 0.0
-                for b_y in range(start_b_y, end_b_y):
-                    for b_x in range(start_b_x, end_b_x):
-                        Q = self._SOAR_Q_CPU(local_a_x, local_a_y, b_x, b_y)
-                        Qx += Q*local_xi[b_y, b_x]
-                Qxi[a_y, a_x] = perturbation_scale*Qx
+        # Additional cutoff number of ghost cells required to calculate SOAR contribution.
+        # Along a periodic axis the random field has no ghost cells of its own, 
+        # so they are wrapped around from the opposite side. Along a non-periodic
+        # axis the random field already contains all 2 + cutoff ghost cells.
+        local_xi = self.local_xi_host
+        ny_halo, nx_halo = local_xi.shape
+        pad_y = int(2 + self.cutoff) if self.periodicNorthSouth else 0
+        pad_x = int(2 + self.cutoff) if self.periodicEastWest else 0
+        
+        rand_ny, rand_nx = ny_halo - 2*pad_y, nx_halo - 2*pad_x
+        
+        # Ghost row j holds the same random numbers as row j + rand_ny (south) or 
+        # j - rand_ny (north). Filling the rows outwards from the interior means the
+        # source row is always filled already, also when the random field is 
+        # smaller than the padding. The columns, including the corners, follow in the same way.
+        local_xi[pad_y:ny_halo-pad_y, pad_x:nx_halo-pad_x] = self.random_numbers_host
+        for j in range(pad_y-1, -1, -1):
+            local_xi[j, pad_x:nx_halo-pad_x] = local_xi[j+rand_ny, pad_x:nx_halo-pad_x]
+        for j in range(ny_halo-pad_y, ny_halo):
+            local_xi[j, pad_x:nx_halo-pad_x] = local_xi[j-rand_ny, pad_x:nx_halo-pad_x]
+        for i in range(pad_x-1, -1, -1):
+            local_xi[:, i] = local_xi[:, i+rand_nx]
+        for i in range(nx_halo-pad_x, nx_halo):
+            local_xi[:, i] = local_xi[:, i-rand_nx]
+        
+        # Apply the SOAR stencil to the whole work buffer. The (coarse_ny+4, coarse_nx+4)
+        # cells that are at least cutoff cells from the edge are not affected by the 
+        # boundary mode, and make up the result.
+        correlate(local_xi, self.soar_kernel_host, output=self.Qxi_host, mode='constant')
+        Qxi = self.Qxi_host[self.cutoff:ny_halo-self.cutoff, self.cutoff:nx_halo-self.cutoff]
+        Qxi *= perturbation_scale
         
         return Qxi
     
@@ -761,9 +944,12 @@ class OceanStateNoise(object):
         d_eta = self._applyQ_CPU(perturbation_scale)
 
         # Interpolate if the coarse grid is not the same as the computational grid
-        # d_eta then becomes (ny+4, nx+4)
+        # d_eta then becomes (ny+4, nx+4).
+        # Otherwise, copy d_eta out of the work buffer, so that callers can keep it
         if self.interpolation_factor > 1:
             d_eta = self._interpolate_CPU(d_eta)
+        else:
+            d_eta = d_eta.copy()
         
         ####
         # Global sync (currently)
@@ -771,39 +957,24 @@ class OceanStateNoise(object):
         #     periodic overlap (1 more global computated ghost cell)
         ####
 
-        d_hu = np.zeros((self.ny, self.nx))
-        d_hv = np.zeros((self.ny, self.nx))
-
         ### Find H_mid:
-        # Read global H (def on intersections) to local, find H_mid
-        # The local memory can then be reused to something else (perhaps use local_d_eta before computing local_d_eta?)
-        H_mid = np.zeros((self.ny, self.nx))
-        for j in range(self.ny):
-            for i in range(self.nx):
-                H_mid[j,i] = 0.25* (H[j,i] + H[j+1, i] + H[j, i+1] + H[j+1, i+1])
+        # H is defined on intersections, H_mid is the average of the four
+        # intersections surrounding each cell
+        H_mid = 0.25*(H[0:self.ny,   0:self.nx  ] + H[1:self.ny+1, 0:self.nx  ] + 
+                      H[0:self.ny,   1:self.nx+1] + H[1:self.ny+1, 1:self.nx+1])
         
-        ####
-        # Local sync
-        ####
-
-        # Compute geostrophically balanced (hu, hv) for each cell within the domain
-        for j in range(0, self.ny):
-            local_j = j + 2     # index in d_eta buffer
-            coriolis = f + beta*local_j*self.dy
-            for i in range(0, self.nx):
-                local_i = i + 2    # index in d_eta buffer
-                h_mid = d_eta[local_j,local_i] + H_mid[j, i]
-                
-                ##############
-                #h_mid = H_mid[j, i]
-                ##############
-                
-                
-                eta_diff_y = (d_eta[local_j+1, local_i] - d_eta[local_j-1, local_i])/(2.0*self.dy)
-                d_hu[j,i] = -(g/coriolis)*h_mid*eta_diff_y
-
-                eta_diff_x = (d_eta[local_j, local_i+1] - d_eta[local_j, local_i-1])/(2.0*self.dx)
-                d_hv[j,i] = (g/coriolis)*h_mid*eta_diff_x   
+        # Compute geostrophically balanced (hu, hv) for each cell within the domain.
+        # Cell (j, i) is found at (j+2, i+2) in the d_eta buffer.
+        local_j = np.arange(self.ny) + 2
+        coriolis = (f + beta*local_j*self.dy)[:, np.newaxis]
+        
+        h_mid = d_eta[2:self.ny+2, 2:self.nx+2] + H_mid
+        
+        eta_diff_y = (d_eta[3:self.ny+3, 2:self.nx+2] - d_eta[1:self.ny+1, 2:self.nx+2])/(2.0*self.dy)
+        d_hu = -(g/coriolis)*h_mid*eta_diff_y
+        
+        eta_diff_x = (d_eta[2:self.ny+2, 3:self.nx+3] - d_eta[2:self.ny+2, 1:self.nx+1])/(2.0*self.dx)
+        d_hv = (g/coriolis)*h_mid*eta_diff_x
     
         return d_eta, d_hu, d_hv
     
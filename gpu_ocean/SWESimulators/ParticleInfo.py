@@ -78,15 +78,6 @@ class ParticleInfo:
         Adds ocean state sample from the drifter positions to the state DataFrame.
         """
         
-        # The timestamp is rounded to nearest integer, so that it is possible to compare to 
-        # other simulation times.
-        rounded_sim_t = round(sim.t)
-        index = self.get_num_samples()
-        
-        if not index == 0:
-            assert(self.state_df[self.state_df[self.columns[0]]==rounded_sim_t].time.count() == 0), \
-                "State sample for time " + str(rounded_sim_t) + " already exists in DataFrame"
-        
         num_drifters = drifter_cells.shape[0]
         eta, hu, hv = sim.download(interior_domain_only=True)
 
@@ -103,6 +94,24 @@ class ParticleInfo:
             extra_sample[:,1] =  hu[self.extraCells[:,1], self.extraCells[:,0]]
             extra_sample[:,2] =  hv[self.extraCells[:,1], self.extraCells[:,0]]  
             
+        self.add_state_sample(sim.t, state_sample, extra_sample)
+        
+    def add_state_sample(self, t, state_sample, extra_sample=None):
+        """
+        Adds an already sampled ocean state at time t to the state DataFrame.
+        state_sample holds (eta, hu, hv) in the drifter cells, and extra_sample 
+        holds (eta, hu, hv) in the extra cells.
+        """
+        
+        # The timestamp is rounded to nearest integer, so that it is possible to compare to 
+        # other simulation times.
+        rounded_sim_t = round(t)
+        index = self.get_num_samples()
+        
+        if not index == 0:
+            assert(self.state_df[self.state_df[self.columns[0]]==rounded_sim_t].time.count() == 0), \
+                "State sample for time " + str(rounded_sim_t) + " already exists in DataFrame"
+        
         self.state_df.loc[index] = {self.columns[0]: rounded_sim_t, 
                                     self.columns[1]: state_sample,
                                     self.columns[2]: extra_sample}
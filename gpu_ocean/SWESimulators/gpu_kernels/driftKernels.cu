@@ -20,10 +20,17 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <http://www.gnu.org/licenses/>.
 */
 
+#include <cuda_fp16.h>
 
 
 /**
   * Kernel that evolves drifter positions along u and v.
+  * The grid might be smaller than the number of drifters, so each thread 
+  * moves every (gridDim.x*blockDim.x)-th drifter.
+  * If DRIFT_NX, DRIFT_NY, DRIFT_DX, DRIFT_DY, DRIFT_INV_DX and DRIFT_INV_DY are 
+  * defined at compile time, the kernel is specialized for that grid. The arguments 
+  * nx_, ny_, dx_ and dy_ are then unused, but are kept so that both variants
+  * share the same signature and launch code.
   */
 extern "C" {
 __global__ void passiveDrifterKernel(
@@ -45,7 +52,7 @@ __global__ void passiveDrifterKernel(
         const int periodic_east_west_,
         
         const int num_drifters_,
-        float* drifters_positions_, const int drifters_pitch_,
+        float* drifters_positions_, const int drifters_pitch_, // [2][num_drifters_ + 1], x in first row, y in second row
         const float sensitivity_) {
 
     //Index of thread within block (only needed in one dim)
@@ -55,17 +62,34 @@ __global__ void passiveDrifterKernel(
     const int bx = blockDim.x * blockIdx.x;
         
     //Index of cell within domain (only needed in one dim)
-    const int ti = bx + tx;
+    const int ti_start = bx + tx;
     
-    if (ti < num_drifters_ + 1) {
-        // Obtain pointer to our particle:
-        float* drifter = (float*) ((char*) drifters_positions_ + drifters_pitch_*ti);
-        float drifter_pos_x = drifter[0];
-        float drifter_pos_y = drifter[1];
+    // Total number of threads in the grid
+    const int ti_stride = gridDim.x * blockDim.x;
+    
+#ifdef DRIFT_NX
+    const float domain_size_x = DRIFT_NX*DRIFT_DX;
+    const float domain_size_y = DRIFT_NY*DRIFT_DY;
+    const float inv_dx = DRIFT_INV_DX;
+    const float inv_dy = DRIFT_INV_DY;
+#else
+    const float domain_size_x = nx_*dx_;
+    const float domain_size_y = ny_*dy_;
+    const float inv_dx = 1.0f/dx_;
+    const float inv_dy = 1.0f/dy_;
+#endif
+    
+    // The drifters are stored as structure of arrays
+    float* const drifters_x = drifters_positions_;
+    float* const drifters_y = (float*) ((char*) drifters_positions_ + drifters_pitch_);
+    
+    for (int ti = ti_start; ti < num_drifters_ + 1; ti += ti_stride) {
+        float drifter_pos_x = drifters_x[ti];
+        float drifter_pos_y = drifters_y[ti];
 
         // Find cell ID for the cell in which our particle is
-        int const cell_id_x = (int)(ceil(drifter_pos_x/dx_) + x_zero_reference_cell_);
-        int const cell_id_y = (int)(ceil(drifter_pos_y/dy_) + y_zero_reference_cell_);
+        int const cell_id_x = (int)(ceil(drifter_pos_x*inv_dx) + x_zero_reference_cell_);
+        int const cell_id_y = (int)(ceil(drifter_pos_y*inv_dy) + y_zero_reference_cell_);
 
         // Read the water velocity from global memory
         float* const eta_row = (float*) ((char*) eta_ptr_ + eta_pitch_*cell_id_y);
@@ -85,23 +109,24 @@ __global__ void passiveDrifterKernel(
         drifter_pos_x += sensitivity_*u*dt_;
         drifter_pos_y += sensitivity_*v*dt_;
             
-        // Ensure boundary conditions
+        // Ensure boundary conditions. This is the same wrap as in 
+        // enforceBoundaryConditions, fused here to avoid a second kernel launch
         if (periodic_east_west_ && (drifter_pos_x < 0)) {
-            drifter_pos_x += + nx_*dx_;
+            drifter_pos_x += + domain_size_x;
         }
-        if (periodic_east_west_ && (drifter_pos_x > nx_*dx_)) {
-            drifter_pos_x -= nx_*dx_;
+        if (periodic_east_west_ && (drifter_pos_x > domain_size_x)) {
+            drifter_pos_x -= domain_size_x;
         }
         if (periodic_north_south_ && (drifter_pos_y < 0)) {
-            drifter_pos_y += ny_*dy_;
+            drifter_pos_y += domain_size_y;
         }
-        if (periodic_north_south_ && (drifter_pos_y > ny_*dy_)) {
-            drifter_pos_y -= ny_*dy_;
+        if (periodic_north_south_ && (drifter_pos_y > domain_size_y)) {
+            drifter_pos_y -= domain_size_y;
         }
 
         // Write to global memory
-        drifter[0] = drifter_pos_x;
-        drifter[1] = drifter_pos_y;
+        drifters_x[ti] = drifter_pos_x;
+        drifters_y[ti] = drifter_pos_y;
     }
 }
 } // extern "C"
@@ -116,16 +141,21 @@ __global__ void enforceBoundaryConditions(
         int periodic_east_west_,
         
         int num_drifters_,
-        float* drifters_positions_, int drifters_pitch_) {
+        float* drifters_positions_, int drifters_pitch_) { // [2][num_drifters_ + 1], x in first row, y in second row
     
     //Index of drifter (only needed in one dimension)
-    const int ti = blockIdx.x * blockDim.x + threadIdx.x;
+    const int ti_start = blockIdx.x * blockDim.x + threadIdx.x;
     
-    if (ti < num_drifters_ + 1) {
-        // Obtain pointer to our particle:
-        float* drifter = (float*) ((char*) drifters_positions_ + drifters_pitch_*ti);
-        float drifter_pos_x = drifter[0];
-        float drifter_pos_y = drifter[1];
+    // Total number of threads in the grid
+    const int ti_stride = gridDim.x * blockDim.x;
+    
+    // The drifters are stored as structure of arrays
+    float* const drifters_x = drifters_positions_;
+    float* const drifters_y = (float*) ((char*) drifters_positions_ + drifters_pitch_);
+    
+    for (int ti = ti_start; ti < num_drifters_ + 1; ti += ti_stride) {
+        float drifter_pos_x = drifters_x[ti];
+        float drifter_pos_y = drifters_y[ti];
 
         // Ensure boundary conditions
         if (periodic_east_west_ && (drifter_pos_x < 0)) {
@@ -142,8 +172,43 @@ __global__ void enforceBoundaryConditions(
         }
 
         // Write to global memory
-        drifter[0] = drifter_pos_x;
-        drifter[1] = drifter_pos_y;
+        drifters_x[ti] = drifter_pos_x;
+        drifters_y[ti] = drifter_pos_y;
+    }
+}
+} // extern "C"
+
+
+
+/**
+  * Kernel that packs the drifter positions into half precision for download.
+  * The positions are stored relative to the domain size, so that the 
+  * precision of the half floats is spent on the range [0, 1].
+  */
+extern "C" {
+__global__ void packDriftersHalf(
+        //domain parameters
+        float domain_size_x_, float domain_size_y_,
+        
+        int num_drifters_,
+        float* drifters_positions_, int drifters_pitch_, // [2][num_drifters_ + 1], x in first row, y in second row
+        __half* packed_positions_) {                     // [2][num_drifters_ + 1], same layout without padding
+    
+    //Index of drifter (only needed in one dimension)
+    const int ti_start = blockIdx.x * blockDim.x + threadIdx.x;
+    
+    // Total number of threads in the grid
+    const int ti_stride = gridDim.x * blockDim.x;
+    
+    float* const drifters_x = drifters_positions_;
+    float* const drifters_y = (float*) ((char*) drifters_positions_ + drifters_pitch_);
+    
+    const float inv_domain_size_x = 1.0f/domain_size_x_;
+    const float inv_domain_size_y = 1.0f/domain_size_y_;
+    
+    for (int ti = ti_start; ti < num_drifters_ + 1; ti += ti_stride) {
+        packed_positions_[ti] = __float2half_rn(drifters_x[ti]*inv_domain_size_x);
+        packed_positions_[num_drifters_ + 1 + ti] = __float2half_rn(drifters_y[ti]*inv_domain_size_y);
     }
 }
 } // extern "C"
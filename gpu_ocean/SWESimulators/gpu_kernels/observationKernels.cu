@@ -44,7 +44,7 @@ __global__ void observeUnderlyingFlow(
 
 
         int num_drifters_,
-        float* drifters_positions_, int drifters_pitch_,
+        float* drifters_positions_, int drifters_pitch_, // [2][num_drifters_ + 1], x in first row, y in second row
         float* observation_ptr_, int observation_pitch_
     ) {
 
@@ -58,10 +58,9 @@ __global__ void observeUnderlyingFlow(
     const int ti = bx + tx;
     
     if (ti < num_drifters_) {
-	// Obtain pointer to my drifter:
-	float* drifter = (float*) ((char*) drifters_positions_ + drifters_pitch_*ti);
-	float drifter_pos_x = drifter[0];
-	float drifter_pos_y = drifter[1];
+	// Read my drifter (stored as structure of arrays):
+	float drifter_pos_x = drifters_positions_[ti];
+	float drifter_pos_y = ((float*) ((char*) drifters_positions_ + drifters_pitch_))[ti];
 
 	// Find cell ID for the cell in which our particle is
 	int const cell_id_x = (int)(floor(drifter_pos_x/dx_) + x_zero_reference_cell_);
@@ -81,3 +80,44 @@ __global__ void observeUnderlyingFlow(
 }
 } // extern "C"
 
+
+
+/**
+  * Kernel that samples the ocean state (eta, hu, hv) in the given cells
+  */
+extern "C" {
+__global__ void sampleOceanState(
+        int num_cells_,
+        int nx_, int ny_,
+
+        int x_zero_reference_cell_, // the cell column representing x0 (x0 at western face)
+        int y_zero_reference_cell_, // the cell row representing y0 (y0 at southern face)
+
+        // Data
+        float* eta_ptr_, int eta_pitch_,
+        float* hu_ptr_, int hu_pitch_,
+        float* hv_ptr_, int hv_pitch_,
+
+        int* cells_ptr_,    // [num_cells_][2] with (x, y) cell indices in the interior domain
+        float* samples_ptr_ // [num_cells_][3] with (eta, hu, hv)
+    ) {
+
+    //Index of the cell we sample (only needed in one dim)
+    const int ti = blockDim.x * blockIdx.x + threadIdx.x;
+
+    if (ti < num_cells_) {
+        // Cells outside the interior domain are clamped to the nearest interior cell,
+        // so that we never read outside the buffers
+        int const cell_id_x = min(max(cells_ptr_[2*ti    ], 0), nx_-1) + x_zero_reference_cell_;
+        int const cell_id_y = min(max(cells_ptr_[2*ti + 1], 0), ny_-1) + y_zero_reference_cell_;
+
+        float* const eta_row = (float*) ((char*) eta_ptr_ + eta_pitch_*cell_id_y);
+        float* const hu_row = (float*) ((char*) hu_ptr_ + hu_pitch_*cell_id_y);
+        float* const hv_row = (float*) ((char*) hv_ptr_ + hv_pitch_*cell_id_y);
+
+        samples_ptr_[3*ti    ] = eta_row[cell_id_x];
+        samples_ptr_[3*ti + 1] =  hu_row[cell_id_x];
+        samples_ptr_[3*ti + 2] =  hv_row[cell_id_x];
+    }
+}
+} // extern "C"
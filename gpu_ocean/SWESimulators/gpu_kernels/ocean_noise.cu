@@ -78,15 +78,16 @@ inline float2 getNorth(const int i, const int j, const int nx_, const int ny_) {
   *  Generates two uniform random numbers based on the ANSIC Linear Congruential 
   *  Generator.
   */
-__device__ float2 ansic_lcg(unsigned long long* seed_ptr) {
-    unsigned long long seed = (*seed_ptr);
-    double denum = 2147483648.0;
-    unsigned long long modulo = 2147483647;
+__device__ float2 ansic_lcg(unsigned int* seed_ptr) {
+    unsigned int seed = (*seed_ptr);
+    const float denum = 2147483648.0f;
+    const unsigned int mask = 0x7fffffff;
 
-    seed = ((seed * 1103515245) + 12345) % modulo; //% 0x7fffffff;
+    // The product wraps modulo 2^32, and the mask reduces it modulo 2^31
+    seed = ((seed * 1103515245u) + 12345u) & mask;
     float u1 = seed / denum;
 
-    seed = ((seed * 1103515245) + 12345) % modulo; //0x7fffffff;
+    seed = ((seed * 1103515245u) + 12345u) & mask;
     float u2 = seed / denum;
 
     (*seed_ptr) = seed;
@@ -99,14 +100,56 @@ __device__ float2 ansic_lcg(unsigned long long* seed_ptr) {
     //return make_float2(u1, u2);
 }
 
+/**
+  *  Advances a seed of the ANSIC Linear Congruential Generator k steps in O(log k)
+  *  operations, by composing the multiplier and increment of the LCG by repeated squaring.
+  */
+__device__ unsigned int lcgSkip(unsigned int seed, unsigned int k) {
+    unsigned int acc_a = 1u;
+    unsigned int acc_c = 0u;
+    unsigned int cur_a = 1103515245u;
+    unsigned int cur_c = 12345u;
+
+    while (k > 0) {
+        if (k & 1u) {
+            acc_a = acc_a*cur_a;
+            acc_c = acc_c*cur_a + cur_c;
+        }
+        cur_c = (cur_a + 1u)*cur_c;
+        cur_a = cur_a*cur_a;
+        k >>= 1;
+    }
+
+    return (acc_a*seed + acc_c) & 0x7fffffff;
+}
+
+/**
+  *  All threads in a block share one seed. Returns the seed of the given thread,
+  *  which draws the two numbers following those of the threads before it in the block.
+  */
+__device__ unsigned int threadSeed(const unsigned int block_seed, const int tx, const int ty) {
+    return lcgSkip(block_seed, 2*(ty*block_width + tx));
+}
+
+/**
+  *  Returns the seed of a block once all its threads have drawn their two numbers.
+  */
+__device__ unsigned int nextBlockSeed(const unsigned int block_seed) {
+    return lcgSkip(block_seed, 2*block_width*block_height);
+}
+
 /**
   *  Generates two random numbers, drawn from a normal distribtion with mean 0 and
   *  variance 1. Based on the Box Muller transform.
   */
 __device__ float2 boxMuller(float2 u) {
-    float r = sqrt(-2.0f*log(u.x));
-    float n1 = r*cospi(2*u.y);
-    float n2 = r*sinpi(2*u.y);
+    float r = sqrtf(-2.0f*logf(u.x));
+    
+    // Sine and cosine of the same angle in one call
+    float sin_theta, cos_theta;
+    sincospif(2.0f*u.y, &sin_theta, &cos_theta);
+    float n1 = r*cos_theta;
+    float n2 = r*sin_theta;
 
     float2 out;
     out.x = n1;
@@ -124,7 +167,7 @@ __global__ void uniformDistribution(
         int random_nx_,
         
         //Data
-        unsigned long long* seed_ptr_, int seed_pitch_,
+        unsigned int* seed_ptr_, int seed_pitch_,
         float* random_ptr_, int random_pitch_
     ) {
 
@@ -132,19 +175,20 @@ __global__ void uniformDistribution(
     const int ti = (blockDim.x * blockIdx.x) + threadIdx.x;
     const int tj = (blockDim.y * blockIdx.y) + threadIdx.y;
 
+    // One seed is shared by all threads in the block
+    unsigned int* const seed_row = (unsigned int*) ((char*) seed_ptr_ + seed_pitch_*blockIdx.y);
+    const unsigned int block_seed = seed_row[blockIdx.x];
+
     // Each thread computes and writes two uniform numbers.
 
     if ((ti < seed_nx_) && (tj < seed_ny_)) {
     
         //Compute pointer to current row in the U array
-        unsigned long long* const seed_row = (unsigned long long*) ((char*) seed_ptr_ + seed_pitch_*tj);
         float* const random_row = (float*) ((char*) random_ptr_ + random_pitch_*tj);
         
-        unsigned long long seed = seed_row[ti];
+        unsigned int seed = threadSeed(block_seed, threadIdx.x, threadIdx.y);
         float2 u = ansic_lcg(&seed);
 
-        seed_row[ti] = seed;
-
         if (2*ti + 1 < random_nx_) {
             random_row[2*ti    ] = u.x;
             random_row[2*ti + 1] = u.y;
@@ -153,6 +197,12 @@ __global__ void uniformDistribution(
             random_row[2*ti    ] = u.x;
         }
     }
+
+    // Advance the block seed once every thread has read it
+    __syncthreads();
+    if ((threadIdx.x == 0) && (threadIdx.y == 0)) {
+        seed_row[blockIdx.x] = nextBlockSeed(block_seed);
+    }
 }
 } // extern "C"
 
@@ -166,7 +216,7 @@ __global__ void normalDistribution(
         int random_nx_,               // random_ny_ is equal to seed_ny_
         
         //Data
-        unsigned long long* seed_ptr_, int seed_pitch_, // size [seed_nx, seed_ny]
+        unsigned int* seed_ptr_, int seed_pitch_, // one seed per block
         float* random_ptr_, int random_pitch_           // size [random_nx, seed_ny]
     ) {
     
@@ -174,20 +224,21 @@ __global__ void normalDistribution(
     const int ti = (blockDim.x * blockIdx.x) + threadIdx.x;
     const int tj = (blockDim.y * blockIdx.y) + threadIdx.y;
 
+    // One seed is shared by all threads in the block
+    unsigned int* const seed_row = (unsigned int*) ((char*) seed_ptr_ + seed_pitch_*blockIdx.y);
+    const unsigned int block_seed = seed_row[blockIdx.x];
+
     // Each thread computes and writes two uniform numbers.
 
     if ((ti < seed_nx_) && (tj < seed_ny_)) {
     
         //Compute pointer to current row in the U array
-        unsigned long long* const seed_row = (unsigned long long*) ((char*) seed_ptr_ + seed_pitch_*tj);
         float* const random_row = (float*) ((char*) random_ptr_ + random_pitch_*tj);
         
-        unsigned long long seed = seed_row[ti];
+        unsigned int seed = threadSeed(block_seed, threadIdx.x, threadIdx.y);
         float2 r = ansic_lcg(&seed);
         float2 u = boxMuller(r);
 
-        seed_row[ti] = seed;
-
         if (2*ti + 1 < random_nx_) {
             random_row[2*ti    ] = u.x;
             random_row[2*ti + 1] = u.y;
@@ -196,6 +247,12 @@ __global__ void normalDistribution(
             random_row[2*ti    ] = u.x;
         }
     }
+
+    // Advance the block seed once every thread has read it
+    __syncthreads();
+    if ((threadIdx.x == 0) && (threadIdx.y == 0)) {
+        seed_row[blockIdx.x] = nextBlockSeed(block_seed);
+    }
 }
 } // extern "C"
 
@@ -244,30 +301,69 @@ __global__ void makePerpendicular(
 
 
 /**
-  * Local function calculating the SOAR function given two grid locations
+  * The SOAR weights (1 + d/L)*exp(-d/L) for all offsets within the cutoff area,
+  * without the amplitude parameter q0. The weights are translation invariant, and are
+  * computed once by the host. Since they depend on the coarse grid resolution and the 
+  * length scale, these are given as the defines SOAR_DX, SOAR_DY and SOAR_L so that 
+  * only OceanStateNoise objects with the same weights share a module.
   */
-__device__ float soar_covariance(int a_x, int a_y, int b_x, int b_y,
-                      float dx, float dy, float soar_q0, float soar_L) {
-    const float dist = sqrt( dx*dx*(a_x - b_x)*(a_x - b_x) +
-                             dy*dy*(a_y - b_y)*(a_y - b_y) );
-    return soar_q0*( 1.0f + dist/soar_L)*exp(-dist/soar_L);
+__constant__ float soar_weights[2*soar_cutoff+1][2*soar_cutoff+1];
+
+/**
+  * Row length of the shared memory tiles of xi used by the SOAR kernels. A warp spans
+  * 32/block_width rows of the tile, and with a row length equal to block_width modulo 32
+  * these rows fall into different shared memory banks in the stencil loop.
+  * Only the first block_width+2*soar_cutoff elements of each row are used.
+  */
+#define xi_tile_width (block_width + 2*soar_cutoff + (32 - (2*soar_cutoff) % 32) % 32)
+
+
+/**
+  * Applies the SOAR stencil to the random numbers xi, which are stored in shared memory
+  * with soar_cutoff ghost cells, for the cell handled by thread (tx, ty).
+  */
+__device__ float soarStencil(float xi[block_height+2*soar_cutoff][xi_tile_width],
+                             const int tx, const int ty, float soar_q0) {
+    // All reads are from local memory, and each thread loops over all cells within the cutoff area.
+    float Qxi = 0.0f;
+    #pragma unroll
+    for (int j = 0; j < 2*soar_cutoff + 1; j++) {
+        #pragma unroll
+        for (int i = 0; i < 2*soar_cutoff + 1; i++) {
+            Qxi += soar_weights[j][i]*xi[ty + j][tx + i];
+        }
+    }
+    return soar_q0*Qxi;
+}
+
+
+/**
+  * Regenerates the normal distributed random number at (i, j) in the random buffer from the seed
+  * it was (or will be) drawn from by the normalDistribution kernel, without updating the seed.
+  */
+__device__ float normalFromSeed(const unsigned int* seed_ptr_, const int seed_pitch_,
+                                const int i, const int j) {
+    const int si = i/2;
+    const unsigned int* const seed_row = (const unsigned int*) ((const char*) seed_ptr_ + seed_pitch_*(j/block_height));
+    unsigned int seed = threadSeed(seed_row[si/block_width], si % block_width, j % block_height);
+    const float2 n = boxMuller(ansic_lcg(&seed));
+    return (i % 2 == 0) ? n.x : n.y;
 }
 
 
 
 /**
   * Kernel that generates a perturbation of the eta field on the coarse grid.
-  * The perturbation is based on a SOAR covariance function using a cut-off value of 2.
+  * The perturbation is based on a SOAR covariance function using a cut-off value of soar_cutoff.
   * The result is according to the use of periodic boundary conditions
   */
 extern "C" {
 __global__ void SOAR(
         // Size of data
         const int nx_, const int ny_,
-        const float dx_, const float dy_,
                 
-        // Parameter for the SOAR function
-        float soar_q0_, float soar_L_, 
+        // Amplitude parameter for the SOAR function
+        float soar_q0_,
 
         // Scale parameter for the final stochastic field
         float perturbation_scale_,
@@ -301,32 +397,30 @@ __global__ void SOAR(
     const int ti = bx + tx;
     const int tj = by + ty;
 
-    const int cutoff = 2;
-
     // Local storage for xi (the random numbers)
-    // Two ghost cells required for the SOAR stencil
-    __shared__ float xi[block_height+4][block_width+4];
+    // soar_cutoff ghost cells required for the SOAR stencil
+    __shared__ float xi[block_height+2*soar_cutoff][xi_tile_width];
 
     // Read random numbers into local memory, using periodic BCs if needed:
     // In order to globally write (nx+4, ny+4) values, we need to read (nx+8, ny+8) values.
-    for (int j = ty; j < block_height+4; j += blockDim.y) {
+    for (int j = ty; j < block_height+2*soar_cutoff; j += blockDim.y) {
         int global_j = 0;
         if (periodic_north_south_) {
-            global_j = (by + j - cutoff - 2 + ny_) % ny_;
+            global_j = (by + j - soar_cutoff - 2 + ny_) % ny_;
         } else {
-            global_j = clamp(by + j, 0, ny_+8);
+            global_j = clamp(by + j, 0, ny_ + 2*(2+soar_cutoff) - 1);
         }
         
         float* const random_row = (float*) ((char*) random_ptr_ + random_pitch_*global_j);
         
-        for (int i = tx; i < block_width+4; i += blockDim.x) {
+        for (int i = tx; i < block_width+2*soar_cutoff; i += blockDim.x) {
         
             int global_i = 0;
             
             if (periodic_east_west_) {
-                global_i = (bx + i - cutoff - 2 + nx_) % nx_;
+                global_i = (bx + i - soar_cutoff - 2 + nx_) % nx_;
             } else {
-                global_i = clamp(bx + i, 0, nx_+8);
+                global_i = clamp(bx + i, 0, nx_ + 2*(2+soar_cutoff) - 1);
             }
             
             xi[j][i] = random_row[global_i];
@@ -337,17 +431,7 @@ __global__ void SOAR(
     
     
     // Compute d_eta using the SOAR covariance function, and store in global memory.
-    // All reads are from local memory, and each thread loops over all cells within the cutoff area.
-    const int a_x = tx + cutoff;
-    const int a_y = ty + cutoff;
-    float Qxi = 0.0f;
-    for (int b_y = ty; b_y < a_y + cutoff + 1; b_y++) {
-        for (int b_x = tx; b_x < a_x + cutoff + 1; b_x++) {
-            const float Q = soar_covariance(a_x, a_y, b_x, b_y,
-                                            dx_, dy_, soar_q0_, soar_L_);
-            Qxi += Q*xi[b_y][b_x];
-        }
-    }
+    const float Qxi = soarStencil(xi, tx, ty, soar_q0_);
     
     // Write eta to global memory
     if ((ti < nx_+4) && (tj < ny_+4)) {
@@ -366,6 +450,139 @@ __global__ void SOAR(
 
 
 
+/**
+  * Kernel that combines normalDistribution and SOAR when the LCG is used.
+  * The random numbers needed by each block are generated directly into shared memory 
+  * from seed_in, instead of being read back from the random buffer. 
+  * In addition, the threads share the work of generating the random buffer and the 
+  * updated seeds as normalDistribution would have, which are written to random_ptr_
+  * and seed_out_ptr_. The seed_in and seed_out buffers must therefore be different.
+  */
+extern "C" {
+__global__ void SOARFused(
+        // Size of data
+        const int nx_, const int ny_,
+                
+        // Amplitude parameter for the SOAR function
+        float soar_q0_,
+
+        // Scale parameter for the final stochastic field
+        float perturbation_scale_,
+        
+        // Periodic domain
+        const int periodic_north_south_, const int periodic_east_west_,
+        
+        // Size of the seed and random buffers
+        const int seed_nx_, const int seed_ny_,
+        const int random_nx_,
+        
+        // seed (input and output) - one seed per block of [block_width, block_height] pairs
+        const unsigned int* seed_in_ptr_, const int seed_in_pitch_,
+        unsigned int* seed_out_ptr_, const int seed_out_pitch_,
+        
+        // random data (output) - if periodic BC: size [nx, ny]
+        //                        else:           size [nx + 8, ny + 8]
+        float* random_ptr_, const int random_pitch_,
+
+        // Coarse grid data variable (output) - size [nx+4, ny+4]
+        // Write to all cells
+        float* coarse_ptr_, const int coarse_pitch_
+    ) {
+
+    //Index of cell within block
+    const int tx = threadIdx.x; 
+    const int ty = threadIdx.y;
+
+    //Index of start of block in the coarse buffer
+    const int bx = blockDim.x * blockIdx.x;
+    const int by = blockDim.y * blockIdx.y;
+
+    //Index of cell in the coarse buffer
+    const int ti = bx + tx;
+    const int tj = by + ty;
+
+    // Local storage for xi (the random numbers)
+    // soar_cutoff ghost cells required for the SOAR stencil
+    __shared__ float xi[block_height+2*soar_cutoff][xi_tile_width];
+
+    // Generate the random numbers for this block, using periodic BCs if needed.
+    // Random numbers normalDistribution does not write (the last column if random_nx 
+    // is odd) are read from the random buffer instead. The indices are clamped to the
+    // random buffer, which has seed_ny rows, and the guard below is only a safety net.
+    for (int j = ty; j < block_height+2*soar_cutoff; j += blockDim.y) {
+        int global_j = 0;
+        if (periodic_north_south_) {
+            global_j = (by + j - soar_cutoff - 2 + ny_) % ny_;
+        } else {
+            global_j = clamp(by + j, 0, ny_ + 2*(2+soar_cutoff) - 1);
+        }
+        
+        float* const random_row = (float*) ((char*) random_ptr_ + random_pitch_*global_j);
+        
+        for (int i = tx; i < block_width+2*soar_cutoff; i += blockDim.x) {
+        
+            int global_i = 0;
+            
+            if (periodic_east_west_) {
+                global_i = (bx + i - soar_cutoff - 2 + nx_) % nx_;
+            } else {
+                global_i = clamp(bx + i, 0, nx_ + 2*(2+soar_cutoff) - 1);
+            }
+            
+            if (((global_i | 1) < random_nx_) && (global_j < seed_ny_)) {
+                xi[j][i] = normalFromSeed(seed_in_ptr_, seed_in_pitch_, global_i, global_j);
+            }
+            else {
+                xi[j][i] = random_row[global_i];
+            }
+        }
+    }
+    
+    // Update the random buffer and the seeds. Each pair of random numbers is handled by
+    // exactly one thread in the grid, so that the work is shared evenly between all blocks.
+    // The seeds are shared by blocks of pairs as in normalDistribution.
+    const int threads_per_block = blockDim.x*blockDim.y;
+    const int num_threads = threads_per_block*gridDim.x*gridDim.y;
+    const int thread_id = (blockIdx.y*gridDim.x + blockIdx.x)*threads_per_block + ty*blockDim.x + tx;
+    for (int s = thread_id; s < seed_nx_*seed_ny_; s += num_threads) {
+        const int si = s % seed_nx_;
+        const int sj = s / seed_nx_;
+        
+        const unsigned int* const seed_in_row = (const unsigned int*) ((const char*) seed_in_ptr_ + seed_in_pitch_*(sj/block_height));
+        float* const random_row = (float*) ((char*) random_ptr_ + random_pitch_*sj);
+        
+        const unsigned int block_seed = seed_in_row[si/block_width];
+        unsigned int seed = threadSeed(block_seed, si % block_width, sj % block_height);
+        const float2 n = boxMuller(ansic_lcg(&seed));
+        
+        if ((si % block_width == 0) && (sj % block_height == 0)) {
+            unsigned int* const seed_out_row = (unsigned int*) ((char*) seed_out_ptr_ + seed_out_pitch_*(sj/block_height));
+            seed_out_row[si/block_width] = nextBlockSeed(block_seed);
+        }
+        
+        if (2*si + 1 < random_nx_) {
+            random_row[2*si    ] = n.x;
+            random_row[2*si + 1] = n.y;
+        }
+    }
+
+    __syncthreads();
+    
+    // Compute d_eta using the SOAR covariance function, and store in global memory.
+    const float Qxi = soarStencil(xi, tx, ty, soar_q0_);
+    
+    // Write eta to global memory
+    if ((ti < nx_+4) && (tj < ny_+4)) {
+
+        //Compute pointer to current row in the coarse array
+        float* coarse_row = (float*) ((char*) coarse_ptr_ + coarse_pitch_*(tj));
+        coarse_row[ti] = perturbation_scale_ * Qxi;
+    }
+}
+} // extern "C"
+
+
+
 
 
 /**
@@ -27,7 +27,7 @@ extern "C" {
 __global__ void squareSum(
         //Discretization parameters
         const int nx_, const int ny_,
-        float* data_ptr_,
+        float* data_ptr_, const int data_pitch_,
         float* result)
 {
 
@@ -35,12 +35,15 @@ __global__ void squareSum(
     volatile float* sdata_volatile = sdata;
     
     unsigned int tid = threadIdx.x;
-    const int numElements = nx_*ny_;
 
     // Square each elements and reduce to "NUM_THREADS" elements
+    // The rows may be padded, so only the first nx_ elements of each row are read
     float threadSum = 0.0f;
-    for (unsigned int i = tid; i < numElements; i += NUM_THREADS) {
-        threadSum += data_ptr_[i]*data_ptr_[i];
+    for (int j = 0; j < ny_; j++) {
+        const float* const data_row = (float*) ((char*) data_ptr_ + data_pitch_*j);
+        for (unsigned int i = tid; i < nx_; i += NUM_THREADS) {
+            threadSum += data_row[i]*data_row[i];
+        }
     }
     sdata[tid] = threadSum;
     __syncthreads();
@@ -81,8 +84,8 @@ extern "C" {
 __global__ void squareSumDouble(
         //Discretization parameters
         const int nx_, const int ny_,
-        float* data_ptr_1,
-        float* data_ptr_2,
+        float* data_ptr_1, const int data_pitch_1,
+        float* data_ptr_2, const int data_pitch_2,
         float* result)
 {
 
@@ -93,21 +96,24 @@ __global__ void squareSumDouble(
     volatile float* snorm2_volatile = snorm2;
     volatile float* sdotpr_volatile = sdot;
     
-    // The input data is interpreted as one dimensional buffers
     unsigned int tid = threadIdx.x;
-    const int numElements = nx_*ny_;
 
     // Square each elements and reduce to "NUM_THREADS" elements
+    // The rows may be padded, so only the first nx_ elements of each row are read
     float threadNorm1 = 0.0f;
     float threadNorm2 = 0.0f;
     float threadDot   = 0.0f;
     float f1, f2;
-    for (unsigned int i = tid; i < numElements; i += NUM_THREADS) {
-        f1 = data_ptr_1[i];
-        f2 = data_ptr_2[i];
-        threadNorm1 += f1*f1;
-        threadNorm2 += f2*f2;
-        threadDot   += f1*f2;
+    for (int j = 0; j < ny_; j++) {
+        const float* const data_row_1 = (float*) ((char*) data_ptr_1 + data_pitch_1*j);
+        const float* const data_row_2 = (float*) ((char*) data_ptr_2 + data_pitch_2*j);
+        for (unsigned int i = tid; i < nx_; i += NUM_THREADS) {
+            f1 = data_row_1[i];
+            f2 = data_row_2[i];
+            threadNorm1 += f1*f1;
+            threadNorm2 += f2*f2;
+            threadDot   += f1*f2;
+        }
     }
     snorm1[tid] = threadNorm1;
     snorm2[tid] = threadNorm2;
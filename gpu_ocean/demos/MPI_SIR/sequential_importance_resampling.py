@@ -52,20 +52,28 @@ def generateDrifterPositions(data_args, num_drifters):
     """Randomly placed drifters, avoiding land."""
     assert(MPI.COMM_WORLD.rank == 0)
     
-    drifters = np.empty((num_drifters, 2))
+    nx, ny = data_args['nx'], data_args['ny']
     
-    for id in range(num_drifters):
-        land = True
-        while(land is True):
-            x = np.random.randint(0, data_args['nx'])
-            y = np.random.randint(0, data_args['ny'])
-            
-            if(data_args['hu0'][y][x] is not np.ma.masked and
-               data_args['hu0'][y-1][x] is not np.ma.masked and data_args['hu0'][y+1][x] is not np.ma.masked and
-               data_args['hu0'][y][x-1] is not np.ma.masked and data_args['hu0'][y][x+1] is not np.ma.masked):
-                drifters[id, 0]  = x * data_args['dx']
-                drifters[id, 1]  = y * data_args['dy']
-                land = False
+    # A cell is valid if neither the cell nor its four neighbours are land.
+    # The mask is converted once to a plain uint8 array, so that the land test
+    # is a bytewise OR of shifted slices without any masked-array overhead.
+    # Slicing excludes the first row and column, which have no southern/western neighbour
+    land = np.ascontiguousarray(np.ma.getmaskarray(data_args['hu0']), dtype=np.uint8)
+    near_land = land[1:ny, 1:nx] | \
+                land[0:ny-1, 1:nx] | land[2:ny+1, 1:nx] | \
+                land[1:ny, 0:nx-1] | land[1:ny, 2:nx+1]
+    valid_y, valid_x = np.nonzero(near_land == 0)
+    
+    if len(valid_x) == 0:
+        raise ValueError("No cells away from land to place drifters in")
+    
+    # Draw all drifters at once among the valid cells. As with the independent
+    # draws this replaces, several drifters may start in the same cell
+    idx = np.random.choice(len(valid_x), size=num_drifters, replace=True)
+    
+    drifters = np.empty((num_drifters, 2))
+    drifters[:, 0] = (valid_x[idx] + 1) * data_args['dx']
+    drifters[:, 1] = (valid_y[idx] + 1) * data_args['dy']
 
     return drifters
     
@@ -73,25 +81,37 @@ def dataAssimilationLoop(ensemble, resampling_times, resampling=True):
     #Perform actual data assimilation        
     t = 0
     
-    observation_times = ensemble.observations.get_observation_times()
+    observation_times = np.asarray(ensemble.observations.get_observation_times(), dtype=np.float64)
+    
+    step_size = 60
+    
+    # Buffer for the drifter cells of all sub steps in the longest assimilation window,
+    # reused for every window. There may be no windows at all.
+    max_sub_steps = int(np.max(np.diff(resampling_times, prepend=t), initial=0) // step_size)
+    num_drifters = ensemble.observations.get_num_drifters(applyDrifterSet=False)
+    drifter_cells_buffer = np.empty((max_sub_steps, num_drifters, 2), dtype=np.int32)
     
     for i, resampling_time in enumerate(resampling_times):
         #Step all nodes in time to next assimilation stage
         assimilation_dt = resampling_time - t
         
-        step_size = 60
         #FIXME: Assert: assimilation_dt divisable with step_size
         sub_steps = int(assimilation_dt // step_size)
         
+        # Index of the latest observed drifters at the end of each sub step
+        sub_step_end_times = t + np.arange(1, sub_steps + 1)*step_size
+        obs_indices = np.maximum(np.searchsorted(observation_times, sub_step_end_times) - 1, 0)
+        
+        # Find latest observed drifters for all sub steps
+        if sub_steps > drifter_cells_buffer.shape[0]:
+            drifter_cells_buffer = np.empty((sub_steps, num_drifters, 2), dtype=np.int32)
+        drifter_cells = drifter_cells_buffer[:sub_steps]
         for j in range(sub_steps):
-            t = ensemble.modelStep(step_size, update_dt=False)
-            
-            # Find latest observed drifters
-            obs_index = min(0, np.searchsorted(observation_times, t) - 1)
-            drifter_cells = ensemble.getDrifterCells(observation_times[obs_index])
-            
-            #Make ParticleInfo for writing to file 
-            ensemble.dumpParticleSample(drifter_cells)
+            ensemble.getDrifterCells(observation_times[obs_indices[j]], out=drifter_cells[j])
+        
+        # Step all sub steps in one batch, which also makes the ParticleInfo for writing to file 
+        if sub_steps > 0:
+            t = ensemble.modelStepBatch(step_size, drifter_cells)
         
         if(resampling):
             #Gather the gaussian weights from all nodes to a global vector on rank 0
@@ -108,20 +128,30 @@ def forecastLoop(ensemble, end_t):
     start_t = ensemble.t
     sub_step_size = 300
     
-    observation_times = ensemble.observations.get_observation_times()
+    observation_times = np.asarray(ensemble.observations.get_observation_times(), dtype=np.float64)
     
     start_t = np.round(start_t)
     end_t = np.round(end_t)
     
-    for dump_time in range(int(start_t), int(end_t), sub_step_size):
+    # Index of the latest observed drifters at the end of each sub step
+    dump_times = np.arange(int(start_t), int(end_t), sub_step_size, dtype=np.int64)
+    sub_step_end_times = dump_times + sub_step_size
+    obs_indices = np.maximum(np.searchsorted(observation_times, sub_step_end_times) - 1, 0)
+    
+    # Update dt once every hour
+    update_dt = (dump_times % 3600 == 0)
+    
+    # Buffer for the drifter cells, reused for every sub step
+    drifter_cells = np.empty((ensemble.observations.get_num_drifters(applyDrifterSet=False), 2), dtype=np.int32)
+    
+    for j in range(len(dump_times)):
         t = ensemble.modelStep(sub_step_size, update_dt=False)
         
-        if(dump_time % 3600 == 0):
+        if(update_dt[j]):
             ensemble.updateDt()
         
         # Find latest observed drifters
-        obs_index = min(0, np.searchsorted(observation_times, t) - 1)
-        drifter_cells = ensemble.getDrifterCells(observation_times[obs_index])
+        ensemble.getDrifterCells(observation_times[obs_indices[j]], out=drifter_cells)
         
         # Store observation from forecast
         ensemble.dumpForecastParticleSample()
@@ -227,7 +257,7 @@ if __name__ == "__main__":
             ]
             
             # Reduce to only relevant files:
-            required_num_files = np.int(np.floor(end_t_forecast/(24*60*60) )) + 1
+            required_num_files = int(end_t_forecast // (24*60*60)) + 1
             source_url = source_url[:required_num_files]
             
             dt = args.dt
@@ -25,6 +25,7 @@ import time
 import numpy as np
 import sys
 import gc
+import os
 
 from testUtils import *
 
@@ -61,6 +62,76 @@ class GPUDrifterTest(BaseDrifterTest):
     def create_large_drifter_set(self, size, domain_x, domain_y):
         self.largeDrifterSet = GPUDrifterCollection(self.gpu_ctx, size, domain_size_x=domain_x, domain_size_y=domain_y) 
         
+    def test_block_width(self):
+        # Without GPU_OCEAN_DRIFTER_TPB and without autotuning, the block width is fixed
+        env_block_width = os.environ.pop("GPU_OCEAN_DRIFTER_TPB", None)
+        try:
+            self.create_small_drifter_set()
+            self.assertEqual(self.smallDrifterSet.block_width, GPUDrifterCollection.default_block_width)
+            
+            self.resamplingDrifterSet = GPUDrifterCollection(self.gpu_ctx, self.resampleNumDrifters,
+                                                             autotune_block_width=True)
+            self.assertIn(self.resamplingDrifterSet.block_width, GPUDrifterCollection.autotune_block_widths)
+        finally:
+            if env_block_width is not None:
+                os.environ["GPU_OCEAN_DRIFTER_TPB"] = env_block_width
+        
 
 
 
+    def test_async_download_equals_getDrifterPositions(self):
+        self.set_positions_small_set()
+        
+        # Move drifters outside the periodic domain, so that the GPU wraps them 
+        # and the host copy becomes outdated
+        self.smallDrifterSet.setDrifterPositions(np.array([[1.2, 0.5], [-0.3, 0.25], [0.5, 1.75]]))
+        self.smallDrifterSet.enforceBoundaryConditions()
+        
+        download = self.smallDrifterSet.getDrifterPositionsAsync()
+        positions = self.smallDrifterSet.getDrifterPositions()
+        assert2DListAlmostEqual(self, download.sync().tolist(), positions.tolist(), 6, 
+                                "async download vs getDrifterPositions")
+        assert2DListAlmostEqual(self, positions.tolist(), [[0.2, 0.5], [0.7, 0.25], [0.5, 0.75]], 6, 
+                                "wrapped drifter positions")
+        
+        # Both staging buffers in turn, and again after the first one is reused
+        downloads = [self.smallDrifterSet.getDrifterPositionsAsync() for i in range(3)]
+        for download in downloads:
+            assert2DListAlmostEqual(self, download.sync().tolist(), positions.tolist(), 6, 
+                                    "staged downloads vs getDrifterPositions")
+    
+    def test_get_all_positions(self):
+        self.set_positions_small_set()
+        self.smallDrifterSet.setDrifterPositions(np.array([[1.2, 0.5], [-0.3, 0.25], [0.5, 1.75]]))
+        self.smallDrifterSet.enforceBoundaryConditions()
+        
+        drifters, observation = self.smallDrifterSet.getAllPositions()
+        assert2DListAlmostEqual(self, drifters.tolist(), self.smallDrifterSet.getDrifterPositions().tolist(), 6,
+                                "getAllPositions, drifters")
+        assertListAlmostEqual(self, observation.tolist(), self.smallDrifterSet.getObservationPosition().tolist(), 6,
+                              "getAllPositions, observation")
+        
+        # The returned arrays are copies, and not views into the host buffer
+        drifters[0, 0] = 0.0
+        self.assertNotEqual(self.smallDrifterSet.getDrifterPositions()[0, 0], 0.0)
+    
+    def test_half_precision_downloads(self):
+        domain_size = np.array([3000.0, 1000.0])
+        self.smallDrifterSet = GPUDrifterCollection(self.gpu_ctx, 3,
+                                                    boundaryConditions=Common.BoundaryConditions(2,2,2,2),
+                                                    domain_size_x=domain_size[0], domain_size_y=domain_size[1],
+                                                    half_precision_downloads=True)
+        self.smallDrifterSet.setDrifterPositions(np.array([[5999.0, 250.7], [-500.7, 999.0], [1234.5, 1777.7]]))
+        self.smallDrifterSet.setObservationPosition(np.array([2047.3, 123.4]))
+        self.smallDrifterSet.enforceBoundaryConditions()
+        
+        # The documented accuracy is domain_size/4096. The small slack covers the
+        # single precision scaling on the GPU and the host
+        bound = domain_size/4096*(1 + 1e-5)
+        drifters, observation = self.smallDrifterSet.getAllPositions()
+        expected = np.array([[2999.0, 250.7], [2499.3, 999.0], [1234.5, 777.7]])
+        for axis in range(2):
+            self.assertLessEqual(np.max(np.abs(drifters[:, axis] - expected[:, axis])), bound[axis])
+        self.assertLessEqual(np.abs(observation[0] - 2047.3), bound[0])
+        self.assertLessEqual(np.abs(observation[1] - 123.4), bound[1])
+    
@@ -360,6 +360,27 @@ class IEWPFOceanTest(unittest.TestCase):
         self.assertAlmostEqual(rel_norm_hu,  0.0, places=5)
         self.assertAlmostEqual(rel_norm_hv,  0.0, places=5)
         
+    def test_kalman_gain_then_draw_from_P_CPU(self):
+        self.run_ensemble()
+        innovation = self.ensemble.getInnovations()[0]
+        observed_drifter_positions = self.ensemble.observeTrueDrifters()
+        
+        # applyKalmanGain_CPU leaves a float64 field as the CPU random numbers,
+        # which the next draw from P must be able to replace
+        self.iewpf.applyKalmanGain_CPU(self.ensemble.particles[0],
+                                       observed_drifter_positions,
+                                       innovation)
+        p_eta, p_hu, p_hv, gamma = self.iewpf.drawFromP_CPU(self.ensemble.particles[0],
+                                                            observed_drifter_positions)
+        
+        random_numbers = self.ensemble.particles[0].small_scale_model_error.getRandomNumbersCPU()
+        self.assertEqual(random_numbers.dtype, np.float32)
+        self.assertEqual(p_eta.shape, (self.ny, self.nx))
+        self.assertEqual(p_hu.shape, (self.ny, self.nx))
+        self.assertEqual(p_hv.shape, (self.ny, self.nx))
+        self.assertTrue(np.all(np.isfinite(p_eta)))
+        self.assertGreater(gamma, 0.0)
+        
     def test_observation_operator_CPU_vs_GPU(self):
         self.run_ensemble()
                       
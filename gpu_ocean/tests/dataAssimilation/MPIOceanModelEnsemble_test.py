@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""
+This software is part of GPU Ocean.
+
+Copyright (C) 2018 SINTEF Digital
+
+This python module implements unit tests for the MPIOceanModelEnsemble class.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import unittest
+import numpy as np
+import sys
+
+from testUtils import *
+
+sys.path.insert(0, '../')
+from SWESimulators import Observation
+from SWESimulators.MPIOceanModelEnsemble import MPIOceanModelEnsemble
+
+
+class MPIOceanModelEnsembleTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dx = 200.0
+        self.dy = 100.0
+
+        # Two drifters observed at two times
+        t = np.array([0.0, 60.0])
+        x = np.array([[10.0, 250.0], [1999.9, 400.0]])
+        y = np.array([[0.0, 150.0], [50.0, 999.9]])
+        observations = Observation.Observation()
+        observations.add_observations_from_arrays(t, x, y)
+
+        # getDrifterCells only depends on the observations and the grid, so
+        # the ensemble is created without the MPI and simulator setup
+        self.ensemble = MPIOceanModelEnsemble.__new__(MPIOceanModelEnsemble)
+        self.ensemble.observations = observations
+        self.ensemble.data_args = {'dx': self.dx, 'dy': self.dy}
+        self.ensemble.t = 60.0
+
+    def test_getDrifterCells(self):
+        cells = self.ensemble.getDrifterCells(0.0)
+        self.assertEqual(cells.dtype, np.int32)
+        self.assertEqual(cells.tolist(), [[0, 0], [9, 0]])
+
+        # Defaults to the current time of the ensemble
+        cells = self.ensemble.getDrifterCells()
+        self.assertEqual(cells.tolist(), [[1, 1], [2, 9]])
+
+    def test_getDrifterCells_out(self):
+        out = np.zeros((2, 2), dtype=np.int32)
+        cells = self.ensemble.getDrifterCells(0.0, out=out)
+        self.assertIs(cells, out)
+        self.assertEqual(out.tolist(), [[0, 0], [9, 0]])
+
+        # The buffer can be a slice of a larger buffer
+        out = np.zeros((3, 2, 2), dtype=np.int32)
+        self.ensemble.getDrifterCells(60.0, out=out[1])
+        self.assertEqual(out[1].tolist(), [[1, 1], [2, 9]])
+        self.assertEqual(out[0].tolist(), [[0, 0], [0, 0]])
+        self.assertEqual(out[2].tolist(), [[0, 0], [0, 0]])
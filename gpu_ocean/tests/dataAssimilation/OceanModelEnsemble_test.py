@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+This software is part of GPU Ocean.
+
+Copyright (C) 2018 SINTEF Digital
+
+This python module implements unit tests for the OceanModelEnsemble class.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import unittest
+import time
+import numpy as np
+import sys
+import gc
+
+from testUtils import *
+
+sys.path.insert(0, '../')
+from SWESimulators import Common
+from SWESimulators.OceanModelEnsemble import OceanModelEnsemble
+
+
+class OceanModelEnsembleTest(unittest.TestCase):
+
+    def setUp(self):
+        self.gpu_ctx = Common.CUDAContext()
+
+        self.nx = 30
+        self.ny = 40
+        self.dx = 200.0
+        self.dy = 200.0
+        self.ghosts = [2,2,2,2] # north, east, south, west
+        dataShape = (self.ny + self.ghosts[0] + self.ghosts[2],
+                     self.nx + self.ghosts[1] + self.ghosts[3])
+
+        eta0 = np.zeros(dataShape, dtype=np.float32)
+        hu0 = np.zeros(dataShape, dtype=np.float32)
+        hv0 = np.zeros(dataShape, dtype=np.float32)
+        H = np.ones((dataShape[0]+1, dataShape[1]+1), dtype=np.float32)*60
+        addCentralBump(eta0, self.nx, self.ny, self.dx, self.dy, self.ghosts)
+
+        self.sim_args = {'dt': 0.9, 'g': 9.81, 'f': 0.0, 'r': 0.0}
+        self.data_args = {'eta0': eta0, 'hu0': hu0, 'hv0': hv0, 'H': H,
+                          'nx': self.nx, 'ny': self.ny, 'dx': self.dx, 'dy': self.dy,
+                          'boundary_conditions': Common.BoundaryConditions(2,2,2,2)}
+
+        # Cells to sample, including cells on the edges of the domain
+        self.drifter_cells = np.array([[0, 0], [15, 20], [self.nx-1, self.ny-1]], dtype=np.int32)
+        self.extra_cells = np.array([[5, 7], [self.nx-1, 0]], dtype=np.int32)
+
+        self.sub_t = 9.0
+        self.num_sub_steps = 4
+
+        self.ensemble = None
+        self.refEnsemble = None
+
+    def tearDown(self):
+        if self.ensemble is not None:
+            self.ensemble.cleanUp()
+            self.ensemble = None
+        if self.refEnsemble is not None:
+            self.refEnsemble.cleanUp()
+            self.refEnsemble = None
+        if self.gpu_ctx is not None:
+            self.assertEqual(sys.getrefcount(self.gpu_ctx), 2)
+            self.gpu_ctx = None
+        gc.collect()
+
+    def create_ensembles(self):
+        self.ensemble = OceanModelEnsemble(self.gpu_ctx, self.sim_args, self.data_args, 2)
+        self.refEnsemble = OceanModelEnsemble(self.gpu_ctx, self.sim_args, self.data_args, 2)
+        for ensemble in [self.ensemble, self.refEnsemble]:
+            for particleInfo in ensemble.particleInfos:
+                particleInfo.setExtraCells(self.extra_cells)
+
+    def test_modelStepBatch_equals_modelStep(self):
+        self.create_ensembles()
+
+        drifter_cells = np.repeat(self.drifter_cells[np.newaxis, :, :], self.num_sub_steps, axis=0)
+        t = self.ensemble.modelStepBatch(self.sub_t, drifter_cells, 0)
+
+        for j in range(self.num_sub_steps):
+            t_ref = self.refEnsemble.modelStep(self.sub_t, 0, update_dt=False)
+            self.refEnsemble.dumpParticleSample(self.drifter_cells)
+
+        self.assertEqual(t, t_ref)
+        for i in range(self.ensemble.numParticles):
+            info = self.ensemble.particleInfos[i]
+            refInfo = self.refEnsemble.particleInfos[i]
+
+            sample_times = info.get_sample_times()
+            self.assertEqual(sample_times.tolist(), refInfo.get_sample_times().tolist())
+            for sample_t in sample_times:
+                assert2DListAlmostEqual(self, info.get_state_samples(sample_t).tolist(),
+                                        refInfo.get_state_samples(sample_t).tolist(), 1e-6,
+                                        "test_modelStepBatch_equals_modelStep, state samples")
+                assert2DListAlmostEqual(self, info.get_extra_sample(sample_t).tolist(),
+                                        refInfo.get_extra_sample(sample_t).tolist(), 1e-6,
+                                        "test_modelStepBatch_equals_modelStep, extra samples")
+
+    def test_modelStepBatch_reuses_buffers(self):
+        self.create_ensembles()
+
+        drifter_cells = np.repeat(self.drifter_cells[np.newaxis, :, :], self.num_sub_steps, axis=0)
+        self.ensemble.modelStepBatch(self.sub_t, drifter_cells, 0)
+        buffers = self.ensemble.sampleBuffers[0]
+
+        # A shorter batch fits in the existing buffers
+        self.ensemble.modelStepBatch(self.sub_t, drifter_cells[:2], 0)
+        self.assertIs(self.ensemble.sampleBuffers[0], buffers)
+
+        # A longer batch needs new buffers
+        drifter_cells = np.repeat(self.drifter_cells[np.newaxis, :, :], self.num_sub_steps+1, axis=0)
+        self.ensemble.modelStepBatch(self.sub_t, drifter_cells, 0)
+        self.assertIsNot(self.ensemble.sampleBuffers[0], buffers)
+        self.assertEqual(self.ensemble.particleInfos[0].get_num_samples(), 2*self.num_sub_steps+3)
@@ -35,11 +35,14 @@ from dataAssimilation.GPUDrifter_test import GPUDrifterTest
 from dataAssimilation.DrifterEnsemble_test import DrifterEnsembleTest
 from dataAssimilation.CPUDrifterEnsemble_test import CPUDrifterEnsembleTest
 from dataAssimilation.IEWPFOcean_test import IEWPFOceanTest
+from dataAssimilation.OceanModelEnsemble_test import OceanModelEnsembleTest
+from dataAssimilation.MPIOceanModelEnsemble_test import MPIOceanModelEnsembleTest
 
 def printSupportedTests():
     print ("Supported tests:")
     print ("0: All, 1: CPUDrifter, 2: GPUDrifter, 3: DrifterEnsembleTest, "
-           + "4: CPUDrifterEnsembleTest, 5: IEWPFOceanTest")
+           + "4: CPUDrifterEnsembleTest, 5: IEWPFOceanTest, 6: OceanModelEnsembleTest, "
+           + "7: MPIOceanModelEnsembleTest")
 
 if (len(sys.argv) < 2):
     print("Usage:")
@@ -63,7 +66,8 @@ test_classes_to_run = None
 if tests == 0:
     test_classes_to_run = [CPUDrifterTest, GPUDrifterTest,
                            DrifterEnsembleTest, CPUDrifterEnsembleTest,
-                           IEWPFOceanTest]
+                           IEWPFOceanTest, OceanModelEnsembleTest,
+                           MPIOceanModelEnsembleTest]
 elif tests == 1:
     test_classes_to_run = [CPUDrifterTest]
 elif tests == 2:
@@ -74,6 +78,10 @@ elif tests == 4:
     test_classes_to_run = [CPUDrifterEnsembleTest]
 elif tests == 5:
     test_classes_to_run = [IEWPFOceanTest]
+elif tests == 6:
+    test_classes_to_run = [OceanModelEnsembleTest]
+elif tests == 7:
+    test_classes_to_run = [MPIOceanModelEnsembleTest]
 else:
     print("Error: " + str(tests) + " is not a supported test number...")
     printSupportedTests()
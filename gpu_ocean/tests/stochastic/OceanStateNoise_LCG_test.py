@@ -18,4 +18,46 @@ class OceanStateNoiseLCGTest(OceanStateNoiseTest):
     """
         
     def useLCG(self):
-        return True
\ No newline at end of file
+        return True
+
+    def fused_vs_separate(self, msg):
+        HCPU = np.ones((self.datashape[0]+1, self.datashape[1]+1))*5
+        self.create_noise()
+        self.allocateBuffers(HCPU)
+        init_seed = self.noise.getSeed()
+
+        # With LCG, the random field is generated within the SOAR kernel (SOARFused)
+        self.noise.perturbOceanState(self.eta, self.hu, self.hv, self.H,
+                                     self.f, self.beta, self.g,
+                                     ghost_cells_x=self.ghost_cells_x,
+                                     ghost_cells_y=self.ghost_cells_y)
+        fused_eta = self.eta.download(self.gpu_stream)
+        fused_seed = self.noise.getSeed()
+        fused_random = self.noise.getRandomNumbers()
+
+        # Same seeds, but with normalDistribution followed by the SOAR kernel
+        self.noise.seed.upload(self.gpu_stream, self.noise._padColumns(init_seed, self.noise.seed_alloc_nx))
+        self.noise.generateNormalDistribution()
+        self.eta.upload(self.gpu_stream, np.zeros(self.datashape, dtype=np.float32))
+        self.hu.upload(self.gpu_stream, np.zeros(self.datashape, dtype=np.float32))
+        self.hv.upload(self.gpu_stream, np.zeros(self.datashape, dtype=np.float32))
+        self.noise.perturbOceanState(self.eta, self.hu, self.hv, self.H,
+                                     self.f, self.beta, self.g,
+                                     ghost_cells_x=self.ghost_cells_x,
+                                     ghost_cells_y=self.ghost_cells_y,
+                                     update_random_field=False)
+        separate_eta = self.eta.download(self.gpu_stream)
+
+        self.assertEqual(fused_seed.tolist(), self.noise.getSeed().tolist(), msg+", seed")
+        assert2DListAlmostEqual(self, fused_random.tolist(), self.noise.getRandomNumbers().tolist(), 6, msg+", random")
+
+        maxVal = np.max(np.abs(separate_eta))
+        assert2DListAlmostEqual(self, (fused_eta/maxVal).tolist(), (separate_eta/maxVal).tolist(), 6, msg+", eta")
+
+    def test_fused_vs_separate_periodic(self):
+        self.fused_vs_separate("test_fused_vs_separate_periodic")
+
+    def test_fused_vs_separate_nonperiodic(self):
+        self.periodicNS = False
+        self.periodicEW = False
+        self.fused_vs_separate("test_fused_vs_separate_nonperiodic")
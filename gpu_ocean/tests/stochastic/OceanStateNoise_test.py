@@ -209,6 +209,40 @@ class OceanStateNoiseTest(OceanStateNoiseTestParent):
         self.perturb_ocean("test_perturb_ocean_NS_periodic")
 
         
+    def geostrophic_balance_reference(self, d_eta, H, f, beta, g):
+        # Reference loop that the vectorized CPU geostrophic balance replaced
+        d_hu = np.zeros((self.ny, self.nx))
+        d_hv = np.zeros((self.ny, self.nx))
+        for j in range(self.ny):
+            local_j = j + 2
+            coriolis = f + beta*local_j*self.dy
+            for i in range(self.nx):
+                local_i = i + 2
+                H_mid = 0.25*(H[j,i] + H[j+1,i] + H[j,i+1] + H[j+1,i+1])
+                h_mid = d_eta[local_j,local_i] + H_mid
+                
+                eta_diff_y = (d_eta[local_j+1, local_i] - d_eta[local_j-1, local_i])/(2.0*self.dy)
+                d_hu[j,i] = -(g/coriolis)*h_mid*eta_diff_y
+                
+                eta_diff_x = (d_eta[local_j, local_i+1] - d_eta[local_j, local_i-1])/(2.0*self.dx)
+                d_hv[j,i] = (g/coriolis)*h_mid*eta_diff_x
+        return d_hu, d_hv
+    
+    def test_geostrophic_balance_CPU(self):
+        self.beta = 1.0e-4
+        HCPU = 5 + np.random.rand(self.ny+1, self.nx+1)
+        
+        self.create_noise()
+        self.noise.generateNormalDistributionCPU()
+        d_eta, d_hu, d_hv = self.noise._obtainOceanPerturbations_CPU(HCPU, self.f, self.beta, self.g)
+        d_huRef, d_hvRef = self.geostrophic_balance_reference(d_eta, HCPU, self.f, self.beta, self.g)
+        
+        # Scale so that largest value becomes ~ 1
+        maxVal = np.max(np.abs(d_huRef))
+        assert2DListAlmostEqual(self, (d_hu/maxVal).tolist(), (d_huRef/maxVal).tolist(), 7, "test_geostrophic_balance_CPU, hu")
+        assert2DListAlmostEqual(self, (d_hv/maxVal).tolist(), (d_hvRef/maxVal).tolist(), 7, "test_geostrophic_balance_CPU, hv")
+    
+    
     def interpolate_perturbation_ocean(self, msg, factor):
         
         self.nx = factor*self.nx
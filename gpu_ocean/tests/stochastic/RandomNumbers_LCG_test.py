@@ -19,4 +19,39 @@ class RandomNumbersLCGTest(RandomNumbersTest):
     """
         
     def useLCG(self):
-        return True
\ No newline at end of file
+        return True
+
+    def test_lcg_skip_constants(self):
+        self.create_noise()
+
+        # Skipping k steps must give the same seed as k single LCG steps
+        seed = np.array([123456789], dtype=np.uint32)
+        expected = []
+        for k in range(600):
+            expected.append(int(seed[0]))
+            seed = ((seed*np.uint32(1103515245)) + np.uint32(12345)) & np.uint32(0x7fffffff)
+
+        skip_a, skip_c = self.noise._lcgSkipConstants(np.arange(600))
+        skipped = (skip_a*np.uint32(123456789) + skip_c) & np.uint32(0x7fffffff)
+        self.assertEqual(skipped.tolist(), expected)
+
+    def test_block_seeds(self):
+        self.create_noise()
+        # The seeds are integers and match exactly, while the GPU Box-Muller 
+        # transform is computed with single precision intrinsics
+        tol = 4
+
+        # One seed per block of random number pairs
+        self.assertEqual(self.noise.getSeed().shape, (self.noise.block_seed_ny, self.noise.block_seed_nx))
+        self.assertEqual(self.noise.block_seed_nx, self.noise.global_size_random_numbers[0])
+        self.assertEqual(self.noise.block_seed_ny, self.noise.global_size_random_numbers[1])
+
+        # The CPU version must reproduce the GPU block seeds and random numbers
+        for i in range(3):
+            self.noise.generateNormalDistribution()
+            self.noise.generateNormalDistributionCPU()
+            self.compare_random(tol, "test_block_seeds, normal " + str(i))
+
+            self.noise.generateUniformDistribution()
+            self.noise.generateUniformDistributionCPU()
+            self.compare_random(tol, "test_block_seeds, uniform " + str(i))
@@ -156,6 +156,23 @@ class RandomNumbersTest(OceanStateNoiseTestParent):
         
         
 
+    def test_CPU_random_numbers_are_host_only(self):
+        self.create_noise()
+        tol = 6
+        
+        self.noise.generateNormalDistribution()
+        random = self.noise.getRandomNumbers()
+        
+        # Generating on the CPU never touches the GPU buffer
+        self.noise.generateNormalDistributionCPU()
+        assert2DListAlmostEqual(self, self.noise.getRandomNumbers().tolist(), random.tolist(), tol, 
+                                "test_CPU_random_numbers_are_host_only, GPU buffer")
+        
+        if not self.noise.use_lcg:
+            # The host Philox generator is independent of the GPU generator
+            assert2DListNotAlmostEqual(self, self.noise.getRandomNumbersCPU().tolist(), random.tolist(), tol, 
+                                       "test_CPU_random_numbers_are_host_only, CPU vs GPU")
+    
     def test_seed_diff(self):
         
         self.create_noise()
@@ -200,3 +217,24 @@ class RandomNumbersTest(OceanStateNoiseTestParent):
         self.assertAlmostEqual((gamma_from_numpy-gamma)/gamma_from_numpy, 0.0, places=5)
 
         
+    def test_padded_buffers(self):
+        # Rows of 128 random numbers are padded to avoid power-of-two strides
+        self.nx = 128
+        self.create_noise()
+        self.assertEqual(self.noise.rand_nx, 128)
+        self.assertEqual(self.noise.rand_alloc_nx, 160)
+        
+        self.noise.generatePerpendicularNormalDistributions()
+        xi = self.noise.getRandomNumbers()
+        nu = self.noise.getPerpendicularRandomNumbers()
+        self.assertEqual(xi.shape, (self.ny, self.nx))
+        self.assertEqual(nu.shape, (self.ny, self.nx))
+        
+        # The reductions must ignore the padding
+        gamma_from_numpy = np.linalg.norm(xi)**2
+        self.assertAlmostEqual((gamma_from_numpy - self.noise.getRandomNorm())/gamma_from_numpy, 0.0, places=5)
+        self.noise.findDoubleNormAndDot()
+        reduction_buffer = self.noise.getReductionBuffer()
+        self.assertAlmostEqual((gamma_from_numpy - reduction_buffer[0,0])/gamma_from_numpy, 0.0, places=5)
+        self.assertAlmostEqual(np.sum(xi*nu)/gamma_from_numpy, 0.0, places=5)
+        